@@ -0,0 +1,162 @@
+# benchmark_extraction.py
+#
+# Times article extraction over saved Yahoo article pages and checks that the
+# single-pass and template extractors return the same data as the previous
+# multi-pass one.
+#
+#   python benchmark_extraction.py --save 20     # save 20 archived article pages as fixtures
+#   python benchmark_extraction.py               # run the benchmark over the fixtures
+
+import argparse
+import glob
+import hashlib
+import os
+import time
+
+from extractors.articles import yfin, template
+from utils.parsing import make_soup, get_parser_backend, record_extraction_timings
+from utils.templates import find_matches
+from utils.archive import get_archived_fetches, connect_archive, get_html_by_hash
+from utils.registry import get_article_extractor
+
+FIXTURES_DIR = os.path.join('fixtures', 'yfin_articles')
+
+
+def extract_article_data_multipass(soup):
+    # The extractor before the single-pass rewrite, kept as the baseline
+    article_data = {}
+    title_element = soup.select_one('h1.cover-title')
+    if title_element:
+        article_data['title'] = title_element.get_text(strip=True)
+    else:
+        article_data['title'] = ''
+        if yfin.is_rate_limit_page(soup):
+            article_data['error'] = "rate_limit_reached"
+    author_element = soup.select_one('div.byline-attr-author')
+    article_data['author'] = author_element.get_text(strip=True) if author_element else ''
+    datetime_element = soup.find('time')
+    article_data['datetime'] = datetime_element['datetime'] if datetime_element and datetime_element.has_attr('datetime') else ''
+    article_element = soup.select_one('div.body')
+    article_data['article'] = yfin.extract_content(article_element) if article_element else ''
+    ticker_symbols = set()
+    ticker_symbols.update(yfin.extract_ticker_symbols_from_links(soup))
+    article_data['ticker_symbols'] = list(ticker_symbols)
+    source_element = soup.select_one('a.subtle-link.fin-size-small')
+    article_data['source'] = source_element['aria-label'] if source_element and source_element.has_attr('aria-label') else ''
+    source_url_element = soup.select_one('a.subtle-link.fin-size-small')
+    article_data['source_url'] = source_url_element['href'] if source_url_element and source_url_element.has_attr('href') else ''
+    return article_data
+
+def save_fixtures(count):
+    # Newest archived Yahoo article pages, skipping throttled and error fetches
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    conn = connect_archive()
+    cur = conn.cursor()
+    saved = 0
+    seen = set()
+    for url, _, content_hash in reversed(get_archived_fetches(latest_only=False)):
+        if saved >= count:
+            break
+        if url in seen or get_article_extractor(url) is not yfin:
+            continue
+        html = get_html_by_hash(cur, content_hash)
+        if not html or not yfin.extract_article_data(make_soup(html)).get('title'):
+            continue
+        seen.add(url)
+        name = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+        with open(os.path.join(FIXTURES_DIR, f"{name}.html"), 'w', encoding='utf-8') as f:
+            f.write(html)
+        saved += 1
+    conn.close()
+    print(f"Saved {saved} fixtures to {FIXTURES_DIR}")
+
+def find_matches_select(plan, soup):
+    # The baseline for the template engine's single pass: one select per selector
+    return {
+        selector: group['compiled'].select(soup, limit=group['limit'] or 0)
+        for selector, group in plan['selectors'].items()
+    }
+
+def run_match_benchmark(pages, backend, repeat):
+    # Times only the element matching of the template, the part the single pass replaces
+    plan = template.TEMPLATES['yahoo_finance']
+    soups = [make_soup(html, backend=backend) for _, html in pages]
+    timings = {}
+    same = True
+    for name, matcher in (('select', find_matches_select), ('single-pass', find_matches)):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for soup in soups:
+                matcher(plan, soup)
+        timings[name] = (time.perf_counter() - started) * 1000 / (repeat * len(soups))
+    for soup in soups:
+        selected = find_matches_select(plan, soup)
+        matched = find_matches(plan, soup)
+        same &= all([id(e) for e in selected[selector]] == [id(e) for e in matched[selector]] for selector in selected)
+    print(f"{backend:12} template matching: select {timings['select']:7.2f} ms/page  single-pass {timings['single-pass']:7.2f} ms/page  same elements: {same}")
+
+def normalize(article_data):
+    # The multi-pass baseline collects tickers in a set, so compare them sorted
+    record_extraction_timings(article_data)
+    return {**article_data, 'ticker_symbols': sorted(article_data['ticker_symbols'])}
+
+def run_benchmark(repeat):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.html'))):
+        with open(path, encoding='utf-8') as f:
+            pages.append((path, f.read()))
+    if not pages:
+        print(f"No fixtures in {FIXTURES_DIR}, run with --save first")
+        return
+
+    results = {}
+    for backend in ('html.parser', 'lxml'):
+        if get_parser_backend(backend) != backend:
+            print(f"{backend}: not installed, skipped")
+            continue
+        extractors = (
+            ('multi-pass', extract_article_data_multipass),
+            ('single-pass', yfin.extract_article_data),
+            ('template', template.get_extractor('yahoo_finance').extract_article_data),
+        )
+        for name, extractor in extractors:
+            parse_time = 0.0
+            extract_time = 0.0
+            outputs = []
+            for _ in range(repeat):
+                outputs = []
+                for path, html in pages:
+                    started = time.perf_counter()
+                    soup = make_soup(html, backend=backend)
+                    parsed = time.perf_counter()
+                    outputs.append(normalize(extractor(soup)))
+                    extract_time += time.perf_counter() - parsed
+                    parse_time += parsed - started
+            results[(backend, name)] = outputs
+            per_page = 1000 / (repeat * len(pages))
+            print(f"{backend:12} {name:12} parse {parse_time * per_page:7.2f} ms/page  extract {extract_time * per_page:7.2f} ms/page")
+
+        if (backend, 'multi-pass') in results:
+            for name in ('single-pass', 'template'):
+                same = results[(backend, 'multi-pass')] == results[(backend, name)]
+                print(f"{backend:12} {name} output identical to multi-pass: {same}")
+        run_match_benchmark(pages, backend, repeat)
+
+    if ('html.parser', 'single-pass') in results and ('lxml', 'single-pass') in results:
+        differing = [
+            path for (path, _), a, b in zip(pages, results[('html.parser', 'single-pass')], results[('lxml', 'single-pass')])
+            if a != b
+        ]
+        print(f"lxml output differs from html.parser on {len(differing)} of {len(pages)} pages")
+        for path in differing:
+            print(f"  {path}")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--save', type=int, metavar='N', help="save the N most recent stored articles as fixtures")
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    args = arg_parser.parse_args()
+    if args.save:
+        save_fixtures(args.save)
+    else:
+        run_benchmark(args.repeat)
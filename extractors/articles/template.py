@@ -0,0 +1,32 @@
+# extractors/articles/template.py
+#
+# Article extractors built from the JSON templates in params.get_template_config()['dir'].
+# A new source needs a template with its domains and fields, no code.
+
+from types import SimpleNamespace
+
+from utils.templates import load_templates, evaluate_template
+
+# Compiled once per process
+TEMPLATES = load_templates()
+
+_extractors = {}
+
+
+def get_extractor(name):
+    """
+    Returns the extractor of a template. It has the same interface as the extractor
+    modules, and its __name__ resolves back to it in the parse worker processes.
+    """
+    if name not in _extractors:
+        template = TEMPLATES[name]
+        _extractors[name] = SimpleNamespace(
+            __name__=f"{__name__}:{name}",
+            DOMAINS=template['domains'],
+            WAIT_SELECTOR=template['wait_selector'],
+            extract_article_data=lambda soup: evaluate_template(template, soup),
+        )
+    return _extractors[name]
+
+def get_extractors():
+    return [get_extractor(name) for name in TEMPLATES]
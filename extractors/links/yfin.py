@@ -1,23 +1,45 @@
-from utils.browser import handle_cookie_consent
+from utils.browser import load_page
 # ... rest of your yfin.py code
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
+from selenium.common.exceptions import NoSuchElementException
+from bs4 import SoupStrainer
+from utils.parsing import make_soup
 import logging
+import params
 
-def extract_links(driver, url):
-    driver.get(url)
-    handle_cookie_consent(driver)
-    wait = WebDriverWait(driver, 3)
-    wait.until(EC.presence_of_element_located((By.ID, "Fin-Stream")))
+# Topic pages this source polls, and the domains its article links are on
+SOURCE_URLS = [params.get_news_url()]
+DOMAINS = ['finance.yahoo.com']
+
+# Element the page is loaded for; the browser only waits for this
+WAIT_SELECTOR = '#Fin-Stream'
+
+# Only the stream subtree is built when parsing a full page
+STREAM_STRAINER = SoupStrainer('div', id='Fin-Stream')
+
+def is_article_link(link):
+    return ("/news/" in link) and (".html" in link) and ("https:" in link)
 
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
+def get_stream_links(fin_stream):
+    return [a['href'] for a in fin_stream.find_all('a', href=True) if is_article_link(a['href'])]
+
+def extract_links_from_html(html):
+    soup = make_soup(html, parse_only=STREAM_STRAINER)
     fin_stream = soup.find('div', id='Fin-Stream')
     if fin_stream:
-        links = [a['href'] for a in fin_stream.find_all('a', href=True)]
+        links = get_stream_links(fin_stream)
     else:
         logging.warning("Fin-Stream div not found")
         links = []
 
-    return links
\ No newline at end of file
+    return links
+
+def extract_links(driver, url):
+    load_page(driver, url, WAIT_SELECTOR)
+    # Transfer only the stream's markup instead of the whole page source
+    try:
+        fin_stream = driver.find_element(By.ID, 'Fin-Stream')
+    except NoSuchElementException:
+        logging.warning("Fin-Stream div not found")
+        return []
+    return get_stream_links(make_soup(fin_stream.get_property('innerHTML')))
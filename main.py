@@ -5,62 +5,74 @@ import json
 from dateutil import parser
 import logging
 import random
+import threading
 
-# from utils.browser import initialize_browser
-from utils.scrape import get_new_articles
+from utils.scrape import poll_source_links, drain_article_backlog, get_link_poll_history
+from utils.registry import get_sources
 from utils.database import initialize_database
 from utils.sentimemt import get_model_responses
-from utils.twitter import process_twitter_data
+from utils.twitter import process_twitter_data, get_twitter_interval
 from utils.analysis import calculate_hourly_averages
+from utils.jobs import start_scoring_workers, get_scoring_job_counts
+from utils.browser import start_browser_pool, close_browser_pool, get_browser_pool_stats
+from utils.parsing import shutdown_parse_executor
+from utils.fetch import get_host_rate_stats
+from utils.scheduler import add_task, trigger_task, run_scheduler, wait_for_tasks, get_scheduler_stats, get_link_poll_interval
 import params
 
-from selenium import webdriver
-from selenium.webdriver.firefox.options import Options
-from selenium.webdriver.firefox.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-
 import os
 import csv
 import sys
 
-from selenium.webdriver.firefox.service import Service
+SCHEDULER_CONFIG = params.get_scheduler_config()
+
+def poll_links(source):
+    if poll_source_links(source):
+        trigger_task(f"article_drain.{source['name']}")
+
+def get_poll_interval(source):
+    if source['poll_interval'] is not None:
+        return source['poll_interval']
+    return get_link_poll_interval(get_link_poll_history(source['urls'][0]))
 
-def initialize_browser():
-    # Get the project root directory (two levels up from browser.py)
-    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    
-    # Path to geckodriver in the main directory
-    geckodriver_path = os.path.join(project_root, 'geckodriver')
-    
-    options = Options()
-    # options.add_argument('-headless')
-    options.set_preference('permissions.default.image', 2)
-    options.set_preference('javascript.enabled', False)
-    options.set_preference('media.autoplay.default', 5)
-    options.set_preference('media.volume_scale', '0.0')
-    
-    service = Service(executable_path='geckodriver')
-    return webdriver.Firefox(service=service, options=options)
+def add_source_tasks(source):
+    # Each source polls and drains its own backlog on its own cadence and concurrency
+    name = source['name']
+    add_task(f"link_poll.{name}", lambda: poll_links(source), lambda: get_poll_interval(source))
+    add_task(f"article_drain.{name}", lambda: drain_article_backlog(source), source['drain_interval'])
+
+def log_status():
+    logging.info(f"Scoring jobs: {get_scoring_job_counts()}")
+    logging.info(f"Browser pool: {get_browser_pool_stats()}")
+    logging.info(f"Host rates: {get_host_rate_stats()}")
+    logging.info(f"Scheduler: {get_scheduler_stats()}")
 
 def main():
     initialize_database()
-    driver = initialize_browser()
-    # service = Service(executable_path="geckodriver")
+    start_browser_pool()
 
-    try:
-        while True:
-            get_new_articles(driver)
-            # process_twitter_data()
-            calculate_hourly_averages()
-            time.sleep(60)
+    # Scorer workers drain the scoring job queue independently of the scraper
+    stop_event = threading.Event()
+    start_scoring_workers(stop_event)
 
+    # Each task runs on its own cadence; link polling adapts to market hours and link arrivals
+    for source in get_sources():
+        if source['urls']:
+            add_source_tasks(source)
+    add_task('aggregation', calculate_hourly_averages, SCHEDULER_CONFIG['aggregation_interval'], initial_delay=30)
+    if SCHEDULER_CONFIG['twitter_enabled']:
+        add_task('twitter', process_twitter_data, get_twitter_interval)
+    add_task('status', log_status, SCHEDULER_CONFIG['status_interval'], initial_delay=SCHEDULER_CONFIG['status_interval'])
 
+    try:
+        run_scheduler(stop_event)
     except KeyboardInterrupt:
         logging.info("Scraper manually terminated.")
     finally:
-        driver.quit()
+        stop_event.set()
+        wait_for_tasks(timeout=30)
+        close_browser_pool()
+        shutdown_parse_executor()
 
 if __name__ == "__main__":
     main()
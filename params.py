@@ -1,26 +1,72 @@
 import csv
+import os
 
 def get_db_name():
 # Database configuration
     return 'crypto.db'
 
+# LLM score cache, stored next to the main database
+def get_score_cache_config():
+    return {
+        "enabled": True,
+        "db_name": os.path.join(os.path.dirname(get_db_name()), 'score_cache.db'),
+        "ttl_seconds": 30 * 24 * 3600,
+        "max_entries": 200000,
+        "evict_every": 500,  # run eviction after this many new entries
+    }
+
+# Compressed archive of fetched article pages, stored next to the main database
+def get_html_archive_config():
+    return {
+        "enabled": True,
+        "db_name": os.path.join(os.path.dirname(get_db_name()), 'html_archive.db'),
+        "zstd_level": 10,                  # zlib level 9 is used when zstandard is not installed
+        "max_bytes": 2 * 1024 ** 3,        # compressed size kept; the oldest fetches are removed first
+        "evict_every": 200,                # check the size limit after this many archived pages
+    }
+
 def get_news_url():
     return "https://finance.yahoo.com/topic/crypto/"
 
 
 
-from importlib import import_module
-def get_extractors():
-        return {
-            "article" : import_module("extractors.articles.yfin"),
-            "link" : import_module("extractors.links.yfin"),
-        }
+# HTML parser used by the extractors: 'html.parser' or 'lxml' (falls back to 'html.parser' when
+# lxml is not installed). Only switch to lxml once benchmark_extraction.py shows identical
+# output on the saved fixtures.
+def get_parser_config():
+    return {
+        "backend": "html.parser",
+    }
+
+# Declarative article extractors: one JSON template per source in the templates directory
+def get_template_config():
+    return {
+        "dir": "templates",
+    }
+
+# News sources, one per module in extractors/links. Sources not listed use "default";
+# a poll_interval of None adapts the polling to market hours and link arrivals.
+def get_source_config():
+    return {
+        "default": {
+            "enabled": True,
+            "concurrency": 2,          # parallel article fetches and browser loads of the source
+            "poll_interval": 300,      # seconds between topic page polls
+            "drain_interval": 120,     # seconds between backlog drains, also run right after new links
+        },
+        "yfin": {
+            "concurrency": 4,
+            "poll_interval": None,
+            "drain_interval": 60,
+        },
+    }
 
 # Models configuration
 def get_models():
     return [
         {
             "name": "google/gemma-2-9b-it",
+            "splits_digits": True,    # "10" is two tokens, so no single-token logprob scores
             "params": {
                 "temperature": 0.1,
                 "top_p": 0.9,
@@ -40,6 +86,7 @@ def get_models():
 
         {
             "name": "Qwen/Qwen2.5-7B-Instruct-Turbo",
+            "splits_digits": True,    # "10" is two tokens, so no single-token logprob scores
             "params": {
                 "temperature": 0.1,
                 "top_p": 0.9,
@@ -58,6 +105,7 @@ def get_models():
         }, 
         {
             "name": "google/gemma-2b-it",
+            "splits_digits": True,    # "10" is two tokens, so no single-token logprob scores
             "params": {
                 "temperature": 0.1,
                 "top_p": 0.9,
@@ -67,6 +115,204 @@ def get_models():
         },                  
     ]
 
+# Plain-HTTP page fetcher, with the Selenium browser as fallback
+def get_fetch_config():
+    return {
+        "enabled": True,
+        "pool_connections": 10,      # hosts kept in the connection pool
+        "pool_maxsize": 10,          # keep-alive connections per host
+        "max_per_host": 4,           # concurrent requests per host
+        "timeout": 15,               # seconds
+        "user_agent": "Mozilla/5.0 (X11; Linux x86_64; rv:130.0) Gecko/20100101 Firefox/130.0",
+    }
+
+# Per-host request rate for page fetches, with backoff when the host throttles us
+def get_host_rate_limit_config():
+    return {
+        "requests_per_second": 1.0,   # starting and maximum request rate per host
+        "min_requests_per_second": 0.05,
+        "burst": 3,                   # token bucket capacity
+        "increase_step": 0.02,        # rate increase per successful request
+        "decrease_factor": 0.5,       # rate multiplier on a rate-limit signal
+        "base_backoff": 30,           # seconds the host is paused on the first rate-limit signal, doubled while it continues
+        "max_backoff": 900,
+        "max_wait": 10,               # links of a host paused for longer are left for a later cycle
+        "retry_base_delay": 300,      # seconds before a throttled article is fetched again, doubled per attempt
+        "retry_max_delay": 6 * 3600,
+        "max_attempts": 6,            # attempts before a throttled article is given up
+    }
+
+# Task cadences of the main loop, in seconds
+def get_scheduler_config():
+    return {
+        "aggregation_interval": 300,
+        "twitter_enabled": False,
+        # The twitter task runs once per hour in the :55-:59 window, see utils/twitter.py
+        "status_interval": 60,
+        "link_poll": {
+            "market_interval": 45,        # US market hours
+            "extended_interval": 120,     # weekdays outside market hours
+            "overnight_interval": 600,    # nights and weekends
+            "min_interval": 20,
+            "max_interval": 900,
+            "burst_interval": 20,         # after a poll that found several new links
+            "burst_links": 3,
+            "target_links_per_poll": 2,   # poll about this often per expected new link
+            "rate_window": 3600,          # seconds of poll history used for the arrival rate
+        },
+        "market_timezone": "America/New_York",
+        "market_open": "09:30",
+        "market_close": "16:00",
+        "extended_open": "07:00",
+        "extended_close": "20:00",
+    }
+
+# Article pipeline: fetch -> parse -> store -> score stages connected by bounded queues
+def get_pipeline_config():
+    return {
+        "fetch_workers": 4,          # threads fetching pages over HTTP
+        "parse_workers": os.cpu_count() or 2,  # processes parsing HTML
+        "queue_size": 16,            # items buffered between two stages
+    }
+
+# Pool of warm browsers for pages that need Selenium
+def get_browser_pool_config():
+    return {
+        "size": 4,                   # drivers kept running
+        "headless": True,
+        "checkout_timeout": 120,     # seconds to wait for a free driver
+        "max_failures": 3,           # consecutive failures before a driver is replaced
+    }
+
+# Browser lifecycle: timeouts, hang watchdog and recycling of long-running drivers
+def get_browser_lifecycle_config():
+    return {
+        "page_load_timeout": 30,     # seconds before driver.get gives up
+        "script_timeout": 10,
+        "hang_timeout": 120,         # a driver checked out longer than this is killed by the watchdog
+        "watchdog_interval": 5,
+        "max_pages": 300,            # recycle a driver after this many pages
+        "max_rss_mb": 1500,          # recycle when geckodriver and Firefox use more memory (needs psutil)
+        "prewarm": True,             # keep a spare driver started so a recycle swaps instantly
+    }
+
+# Browser profile; the lean profile only loads what the extractors read
+def get_browser_profile_config():
+    return {
+        "lean": True,
+        "page_load_strategy": "eager",   # 'normal' waits for the load event, 'eager' for DOMContentLoaded, 'none' returns at once
+        "block_stylesheets": True,
+        "block_fonts": True,
+        "block_subframes": True,
+        "block_third_party": True,       # hosts outside first_party_domains are not loaded
+        "first_party_domains": ["finance.yahoo.com", "consent.yahoo.com", "guce.yahoo.com"],
+        "wait_timeout": 3,               # seconds to wait for the element an extractor needs
+    }
+
+# Cookie consent, handled once per browser session
+def get_consent_config():
+    return {
+        "handshake_url": "https://finance.yahoo.com/",  # page loaded at driver startup to answer the consent dialog
+        "timeout": 5,                                     # seconds to wait for the reject button during the handshake
+        # Consent cookies set before the handshake, e.g. exported from a session that already rejected
+        # [{"name": "...", "value": "...", "domain": ".yahoo.com"}]
+        "cookies": [],
+    }
+
+# Scoring engine configuration
+def get_scoring_config():
+    return {
+        "max_concurrency": 16,           # in-flight requests across all models
+        "max_concurrency_per_model": 16, # ceiling for the adaptive per-model concurrency
+        "request_timeout": 60,           # seconds
+        "mode": "per_aspect",            # "per_aspect", "multi_aspect" (one JSON request per model)
+                                         # or "logprob" (one token per aspect, expected score from logprobs)
+        "json_response_format": True,    # request a JSON schema response in multi_aspect mode
+        "top_logprobs": 20,              # number of candidate tokens requested in logprob mode
+        "multi_crypto": False,           # score articles matching several cryptos with one request per model
+    }
+
+# Near-duplicate article detection (MinHash over word shingles)
+def get_dedup_config():
+    return {
+        "enabled": True,
+        "shingle_size": 5,      # words per shingle
+        "num_perm": 64,         # MinHash signature length
+        "bands": 16,            # LSH bands, num_perm must be divisible by bands
+        "threshold": 0.85,      # estimated Jaccard similarity to flag a near-duplicate
+        "min_words": 40,        # shorter articles are not indexed
+        "copy_scores": True,    # copy the original's scores instead of rescoring
+    }
+
+# Cheap-model-first scoring cascade. Models are listed cheapest first; larger
+# models are only called when the cheaper ones give an ambiguous score.
+def get_cascade_config():
+    return {
+        "enabled": False,
+        "models": [
+            "google/gemma-2b-it",
+            "meta-llama/Meta-Llama-3-8B-Instruct-Lite",
+            "Qwen/Qwen2.5-7B-Instruct-Turbo",
+            "meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo",
+            "google/gemma-2-9b-it",
+        ],
+        "default": {
+            "depth": 5,                # maximum number of models per aspect
+            "mid_range": [4, 7],       # scores in this range are ambiguous
+            "min_confidence": 0.6,     # logprob confidence below this is ambiguous
+            "second_opinion": True,    # always ask the second model for a quick check
+            "max_disagreement": 2,     # larger score gaps with the second opinion are ambiguous
+        },
+        # Per-aspect overrides of the default settings
+        "aspects": {
+            "Overall Sentiment": {"depth": 5, "mid_range": [5, 6]},
+            "Regulatory Impact": {"depth": 3},
+            "Technological Impact": {"depth": 3},
+        },
+    }
+
+# Durable scoring job queue
+def get_scoring_jobs_config():
+    return {
+        "workers": 2,            # scorer worker threads
+        "batch_size": 20,        # jobs claimed per worker iteration
+        "lease_seconds": 600,    # a leased job is reclaimed after this long, renewed while it is scored
+        "max_attempts": 5,       # jobs are marked failed after this many attempts
+        "retry_delay": 60,       # seconds, doubled after each failed attempt
+        "poll_interval": 5,      # seconds to wait when the queue is empty
+    }
+
+# Per-model rate limiting for the scoring engine. Models may override any of
+# these values with a "rate_limit" dict in their configuration.
+def get_rate_limit_config():
+    return {
+        "requests_per_second": 5.0,   # token bucket refill rate
+        "burst": 10,                  # token bucket capacity
+        "initial_concurrency": 4,     # starting in-flight limit per model
+        "min_concurrency": 1,
+        "increase_step": 1.0,         # additive increase per window of successful requests
+        "decrease_factor": 0.5,       # multiplicative decrease on a 429
+        "max_retries": 6,
+        "base_retry_delay": 1.0,      # seconds, used when no Retry-After header is sent
+        "max_retry_delay": 60.0,
+    }
+
+# Local CPU-only scorer distilled from the stored LLM scores. It gives a provisional
+# score as soon as an article is stored and keeps scoring during API outages.
+def get_distill_config():
+    return {
+        "enabled": True,
+        "model": {
+            "name": "local/distilled-ridge",
+            "backend": "local",        # scored by utils/distill.py instead of the Together API
+            "params": {},
+        },
+        "n_features": 2 ** 18,   # hashing vectorizer size
+        "alpha": 1.0,            # ridge regularization
+        "min_samples": 50,       # minimum labelled items per aspect to fit a regressor
+        "model_dir": os.path.dirname(get_db_name()),
+    }
+
 # Crypto keywords
 def get_crypto_keywords():
     return {
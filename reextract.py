@@ -0,0 +1,114 @@
+# reextract.py
+#
+# Runs an extractor over archived article pages and updates the stored articles,
+# without a browser or network access.
+#
+#   python reextract.py                              # every archived article, latest usable fetch
+#                                                    # per url, with the article extractor of its domain
+#   python reextract.py --start 2024-06-01 --end 2024-07-01
+#   python reextract.py --extractor extractors.articles.yfin --dry-run
+#   python reextract.py --extractor extractors.articles.template:yahoo_finance --dry-run
+
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from dateutil import parser
+
+from utils.archive import get_archived_fetches, connect_archive, get_html_by_hash
+from utils.database import build_article_row, update_articles
+from utils.parsing import make_soup
+from utils.registry import resolve_extractor, get_article_extractor
+
+BATCH_SIZE = 50
+
+
+def group_fetches_by_url(fetches):
+    # Each url's (fetched_unix, hash) fetches, newest first
+    pages = {}
+    for url, fetched_unix, content_hash in fetches:
+        pages.setdefault(url, []).append((fetched_unix, content_hash))
+    return [(url, page_fetches[::-1]) for url, page_fetches in pages.items()]
+
+def extract_batch(pages, extractor_name=None):
+    """
+    Extracts a batch of archived articles in a worker process. Each article takes
+    the newest of its fetches that extracts a title, so a throttled or error page
+    fetched last does not hide an earlier good fetch.
+
+    Parameters:
+        pages (list of tuple): (url, list of (fetched_unix, hash) newest first).
+        extractor_name (str): The extractor to use for every page, 'module' or
+            'module:template'. By default each page uses the extractor of its domain.
+
+    Returns:
+        list of tuple: Article rows from build_article_row. Articles without any
+        fetch that extracts a title are left out.
+    """
+    extractor = resolve_extractor(extractor_name) if extractor_name else None
+    conn = connect_archive()
+    cur = conn.cursor()
+    rows = []
+    for url, page_fetches in pages:
+        page_extractor = extractor or get_article_extractor(url)
+        if page_extractor is None:
+            logging.warning(f"No article extractor for {url}")
+            continue
+        tried = set()
+        for fetched_unix, content_hash in page_fetches:
+            if content_hash in tried:
+                continue
+            tried.add(content_hash)
+            html = get_html_by_hash(cur, content_hash)
+            if not html:
+                continue
+            try:
+                data = page_extractor.extract_article_data(make_soup(html))
+            except Exception as e:
+                logging.error(f"Re-extraction failed for {url} fetched at {fetched_unix}: {e}")
+                continue
+            if data.get('title'):
+                rows.append(build_article_row(url, data))
+                break
+    conn.close()
+    return rows
+
+def reextract_articles(start_unix=None, end_unix=None, extractor_name=None, workers=None, dry_run=False):
+    """
+    Re-extracts the newest usable archived fetch of every article in a time range on a
+    process pool and writes the results back in bulk.
+
+    Returns:
+        tuple: (number of articles extracted, number of articles changed)
+    """
+    pages = group_fetches_by_url(get_archived_fetches(start_unix, end_unix, latest_only=False))
+    batches = [pages[i:i + BATCH_SIZE] for i in range(0, len(pages), BATCH_SIZE)]
+    logging.info(f"Re-extracting {len(pages)} archived articles in {len(batches)} batches")
+
+    started = time.perf_counter()
+    extracted = 0
+    changed = 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for rows in executor.map(extract_batch, batches, [extractor_name] * len(batches)):
+            extracted += len(rows)
+            if not dry_run:
+                changed += update_articles(rows)
+
+    logging.info(f"Re-extracted {extracted} articles in {time.perf_counter() - started:.1f}s, {changed} articles changed")
+    return extracted, changed
+
+def parse_time(value):
+    return int(parser.parse(value).timestamp()) if value else None
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    arg_parser = argparse.ArgumentParser(description="Re-extract archived article pages")
+    arg_parser.add_argument('--start', help="earliest fetch time, e.g. 2024-06-01")
+    arg_parser.add_argument('--end', help="latest fetch time")
+    arg_parser.add_argument('--extractor', help="module path or module:template, the extractor of each page's domain by default")
+    arg_parser.add_argument('--workers', type=int, help="worker processes, one per core by default")
+    arg_parser.add_argument('--dry-run', action='store_true', help="extract without updating the articles")
+    args = arg_parser.parse_args()
+    reextract_articles(parse_time(args.start), parse_time(args.end), args.extractor, args.workers, args.dry_run)
@@ -1,5 +1,6 @@
 # utils/analysis.py
 
+import json
 import sqlite3
 from datetime import datetime, timezone
 import params
@@ -30,6 +31,19 @@ def remove_outliers(data):
     upper_bound = q3 + 1.5 * iqr
     return [x for x in data if lower_bound <= x <= upper_bound]
 
+def score_column(aspect):
+    """
+    Returns the SQL expression used to read an aspect score. The continuous expected
+    score from logprob scoring is preferred when it was stored, otherwise the integer score.
+
+    Parameters:
+        aspect (str): The aspect column name.
+
+    Returns:
+        str: The SQL column expression.
+    """
+    return f'COALESCE("{aspect}_expected", "{aspect}")'
+
 def connect_database(db_name):
     """
     Establishes a connection to the SQLite database.
@@ -40,7 +54,7 @@ def connect_database(db_name):
     Returns:
         sqlite3.Connection: The database connection object.
     """
-    return sqlite3.connect(db_name)
+    return sqlite3.connect(db_name, timeout=30)
 
 def ensure_hourly_averages_table(cur, crypto, news_aspects, twitter_aspects):
     """
@@ -215,12 +229,54 @@ def get_common_items(cur, crypto, models, start_unix, end_unix, data_type):
     if model_items:
         common_items = set.intersection(*model_items)
         logging.info(f"Found {len(common_items)} common {key_column}s across all models for crypto '{crypto}'.")
+
+        # Items scored by the cascade only have rows for the models that contributed
+        cascade_items = get_cascade_items(cur, crypto, data_type) & set.union(*model_items)
+        if cascade_items - common_items:
+            logging.info(f"Adding {len(cascade_items - common_items)} cascade-scored {key_column}s for crypto '{crypto}'.")
+        common_items |= cascade_items
     else:
         common_items = set()
         logging.info(f"No common {key_column}s found for crypto '{crypto}'.")
 
     return common_items
 
+def get_cascade_items(cur, crypto, data_type):
+    """
+    Retrieves the URLs or tweet IDs that were scored through the model cascade for a given crypto.
+
+    Parameters:
+        cur (sqlite3.Cursor): The database cursor.
+        crypto (str): The cryptocurrency name.
+        data_type (str): Type of data ('news' or 'twitter').
+
+    Returns:
+        set: A set of URLs or tweet IDs.
+    """
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='scoring_cascade'")
+    if not cur.fetchone():
+        return set()
+    cur.execute("SELECT DISTINCT item_id FROM scoring_cascade WHERE item_type = ? AND crypto = ?", (data_type, crypto))
+    return set(row[0] for row in cur.fetchall())
+
+def get_cascade_models(cur, crypto, data_type, item):
+    """
+    Retrieves which models contributed to each aspect score of a cascade-scored item.
+
+    Parameters:
+        cur (sqlite3.Cursor): The database cursor.
+        crypto (str): The cryptocurrency name.
+        data_type (str): Type of data ('news' or 'twitter').
+        item (str): The URL or tweet ID.
+
+    Returns:
+        dict: Mapping of aspect name to the list of contributing model names.
+    """
+    cur.execute("""
+        SELECT aspect, models FROM scoring_cascade WHERE item_type = ? AND crypto = ? AND item_id = ?
+    """, (data_type, crypto, item))
+    return {aspect: json.loads(models) for aspect, models in cur.fetchall()}
+
 def collect_aspect_scores(cur, crypto, models, items, data_type, aspects):
     """
     Collects aspect scores for the common URLs or tweet IDs.
@@ -237,8 +293,14 @@ def collect_aspect_scores(cur, crypto, models, items, data_type, aspects):
         dict: Dictionary mapping each aspect to a list of scores.
     """
     aspect_scores = {aspect: [] for aspect in aspects}
+    cascade_items = get_cascade_items(cur, crypto, data_type)
 
     for item in items:
+        # For cascade-scored aspects, only the contributing models count, averaged into a
+        # single score so that escalated (ambiguous) items do not outweigh clear ones
+        cascade_models = get_cascade_models(cur, crypto, data_type, item) if item in cascade_items else {}
+        cascade_scores = {aspect: [] for aspect in cascade_models if aspect in aspect_scores}
+
         for model in models:
             if data_type == 'news':
                 table = f"{crypto}_{model['name'].replace('/', '_').replace('-', '_').replace('.', '_')}_news"
@@ -248,16 +310,25 @@ def collect_aspect_scores(cur, crypto, models, items, data_type, aspects):
                 continue
 
             # Retrieve aspect scores
-            columns = ', '.join([f'"{aspect}"' for aspect in aspects])
+            columns = ', '.join([score_column(aspect) for aspect in aspects])
             query = f"SELECT {columns} FROM \"{table}\" WHERE {'url' if data_type == 'news' else 'tweet_id'} = ?"
             cur.execute(query, (item,))
             row = cur.fetchone()
             if row:
                 for i, aspect in enumerate(aspects):
                     score = row[i]
-                    if score is not None:
+                    if score is None:
+                        continue
+                    if aspect in cascade_scores:
+                        if model['name'] in cascade_models[aspect]:
+                            cascade_scores[aspect].append(score)
+                    else:
                         aspect_scores[aspect].append(score)
 
+        for aspect, scores in cascade_scores.items():
+            if scores:
+                aspect_scores[aspect].append(sum(scores) / len(scores))
+
     return aspect_scores
 
 def calculate_average_scores(aspect_scores):
@@ -413,7 +484,8 @@ def process_and_store_processed_data(cur, crypto, models, data_type, items, aspe
             else:
                 continue
 
-            query = f"SELECT {', '.join([f'\"{aspect}\"' for aspect in aspects])} FROM \"{table}\" WHERE {key_column} = ?"
+            columns = ', '.join([score_column(aspect) for aspect in aspects])
+            query = f"SELECT {columns} FROM \"{table}\" WHERE {key_column} = ?"
             cur.execute(query, (item,))
             row = cur.fetchone()
 
@@ -455,6 +527,7 @@ def calculate_hourly_averages():
     # Retrieve configurations from params.py
     DB_NAME = params.get_db_name()
     models = params.get_models()
+    distill_config = params.get_distill_config()
     cryptos = params.get_crypto_keywords()
     news_prompts = params.get_news_prompts()
     twitter_prompts = params.get_twitter_prompts()
@@ -478,10 +551,15 @@ def calculate_hourly_averages():
             ensure_hourly_averages_table(cur, crypto, news_aspects, twitter_aspects)
 
             # -------------------- Process News --------------------
-            common_urls = get_common_items(cur, crypto, models, start_unix, end_unix, 'news')
+            news_models = models
+            common_urls = get_common_items(cur, crypto, news_models, start_unix, end_unix, 'news')
+            if not common_urls and distill_config['enabled']:
+                # No LLM scores yet (e.g. during an API outage), use the provisional local scores
+                news_models = [distill_config['model']]
+                common_urls = get_common_items(cur, crypto, news_models, start_unix, end_unix, 'news')
             if common_urls:
                 # Collect aspect scores for news
-                aspect_scores_news = collect_aspect_scores(cur, crypto, models, common_urls, 'news', news_aspects)
+                aspect_scores_news = collect_aspect_scores(cur, crypto, news_models, common_urls, 'news', news_aspects)
                 averages_news = calculate_average_scores(aspect_scores_news)
 
                 # Store hourly averages for news
@@ -495,15 +573,19 @@ def calculate_hourly_averages():
                 )
 
                 # Additionally, store processed outlier data for each model
-                process_and_store_processed_data(cur, crypto, models, 'news', common_urls, news_aspects)
+                process_and_store_processed_data(cur, crypto, news_models, 'news', common_urls, news_aspects)
             else:
                 logging.info(f"No common URLs to process for crypto '{crypto}'.")
 
             # -------------------- Process Twitter --------------------
-            common_tweet_ids = get_common_items(cur, crypto, models, start_unix, end_unix, 'twitter')
+            twitter_models = models
+            common_tweet_ids = get_common_items(cur, crypto, twitter_models, start_unix, end_unix, 'twitter')
+            if not common_tweet_ids and distill_config['enabled']:
+                twitter_models = [distill_config['model']]
+                common_tweet_ids = get_common_items(cur, crypto, twitter_models, start_unix, end_unix, 'twitter')
             if common_tweet_ids:
                 # Collect aspect scores for twitter
-                aspect_scores_twitter = collect_aspect_scores(cur, crypto, models, common_tweet_ids, 'twitter', twitter_aspects)
+                aspect_scores_twitter = collect_aspect_scores(cur, crypto, twitter_models, common_tweet_ids, 'twitter', twitter_aspects)
                 averages_twitter = calculate_average_scores(aspect_scores_twitter)
 
                 # Store hourly averages for twitter
@@ -517,7 +599,7 @@ def calculate_hourly_averages():
                 )
 
                 # Additionally, store processed outlier data for each model
-                process_and_store_processed_data(cur, crypto, models, 'twitter', common_tweet_ids, twitter_aspects)
+                process_and_store_processed_data(cur, crypto, twitter_models, 'twitter', common_tweet_ids, twitter_aspects)
             else:
                 logging.info(f"No common tweet IDs to process for crypto '{crypto}'.")
 
@@ -0,0 +1,232 @@
+# utils/archive.py
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+
+import params
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ARCHIVE_CONFIG = params.get_html_archive_config()
+ARCHIVE_DB_NAME = ARCHIVE_CONFIG['db_name']
+
+_stats = {'archived': 0, 'new_blobs': 0, 'evicted_fetches': 0}
+_stats_lock = threading.Lock()
+_initialized = False
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+def connect_archive():
+    return sqlite3.connect(ARCHIVE_DB_NAME, timeout=30)
+
+def initialize_archive():
+    global _initialized
+    conn = connect_archive()
+    cur = conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    # Page contents, stored once per distinct HTML
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS html_blobs (
+            hash TEXT PRIMARY KEY,
+            codec TEXT,
+            raw_size INTEGER,
+            stored_size INTEGER,
+            data BLOB
+        )
+    """)
+    # One row per fetch, pointing at its blob
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS html_fetches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT,
+            fetched_unix INTEGER,
+            hash TEXT,
+            source TEXT
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_html_fetches_url ON html_fetches (url, fetched_unix)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_html_fetches_hash ON html_fetches (hash)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_html_fetches_time ON html_fetches (fetched_unix)")
+    conn.commit()
+    conn.close()
+    _initialized = True
+
+def compress_html(html):
+    """
+    Returns:
+        tuple: (codec name, compressed bytes), zstd if available and zlib otherwise.
+    """
+    raw = html.encode('utf-8')
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=ARCHIVE_CONFIG['zstd_level']).compress(raw)
+    return 'zlib', zlib.compress(raw, 9)
+
+def decompress_html(codec, data):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("The archive holds zstd pages but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+    return zlib.decompress(data).decode('utf-8')
+
+def archive_page(url, html, source='http', fetched_unix=None):
+    """
+    Stores a fetched page. The HTML is keyed by its SHA-256, so refetching an
+    unchanged page only adds a fetch row.
+
+    Parameters:
+        url (str): The page url.
+        html (str): The page HTML.
+        source (str): How the page was fetched ('http' or 'browser').
+        fetched_unix (int): Fetch time, now by default.
+
+    Returns:
+        str: The content hash, or None if archiving is disabled.
+    """
+    if not ARCHIVE_CONFIG['enabled'] or not html:
+        return None
+    if not _initialized:
+        initialize_archive()
+
+    content_hash = hashlib.sha256(html.encode('utf-8')).hexdigest()
+    conn = connect_archive()
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM html_blobs WHERE hash = ?", (content_hash,))
+    if not cur.fetchone():
+        codec, data = compress_html(html)
+        cur.execute("""
+            INSERT OR IGNORE INTO html_blobs (hash, codec, raw_size, stored_size, data)
+            VALUES (?, ?, ?, ?, ?)
+        """, (content_hash, codec, len(html.encode('utf-8')), len(data), data))
+        _count('new_blobs', cur.rowcount)
+    cur.execute("""
+        INSERT INTO html_fetches (url, fetched_unix, hash, source) VALUES (?, ?, ?, ?)
+    """, (url, fetched_unix or int(time.time()), content_hash, source))
+    conn.commit()
+    conn.close()
+
+    _count('archived')
+    if _stats['archived'] % ARCHIVE_CONFIG['evict_every'] == 0:
+        enforce_archive_retention()
+    return content_hash
+
+def get_html_by_hash(cur, content_hash):
+    cur.execute("SELECT codec, data FROM html_blobs WHERE hash = ?", (content_hash,))
+    row = cur.fetchone()
+    return decompress_html(*row) if row else None
+
+def get_archived_html(url, at_unix=None):
+    """
+    Returns the latest archived HTML of a page, or the latest fetched at or before at_unix.
+
+    Returns:
+        tuple or None: (html, fetched_unix), or None if the page is not archived.
+    """
+    if not _initialized:
+        initialize_archive()
+    conn = connect_archive()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT hash, fetched_unix FROM html_fetches
+        WHERE url = ? AND fetched_unix <= ?
+        ORDER BY fetched_unix DESC LIMIT 1
+    """, (url, at_unix if at_unix is not None else 2 ** 62))
+    row = cur.fetchone()
+    result = (get_html_by_hash(cur, row[0]), row[1]) if row else None
+    conn.close()
+    return result
+
+def get_archived_fetches(start_unix=None, end_unix=None, latest_only=True):
+    """
+    Lists archived fetches in a time range.
+
+    Parameters:
+        start_unix (int): Earliest fetch time, unbounded by default.
+        end_unix (int): Latest fetch time, unbounded by default.
+        latest_only (bool): Keep only the most recent fetch of each url.
+
+    Returns:
+        list of tuple: (url, fetched_unix, hash), ordered by fetch time.
+    """
+    if not _initialized:
+        initialize_archive()
+    conn = connect_archive()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT url, fetched_unix, hash FROM html_fetches
+        WHERE fetched_unix >= ? AND fetched_unix <= ?
+        ORDER BY fetched_unix, id
+    """, (start_unix or 0, end_unix if end_unix is not None else 2 ** 62))
+    fetches = cur.fetchall()
+    conn.close()
+    if latest_only:
+        fetches = list({url: (url, fetched_unix, content_hash) for url, fetched_unix, content_hash in fetches}.values())
+    return fetches
+
+def enforce_archive_retention(max_bytes=None):
+    """
+    Removes the oldest fetches until the compressed size of the blobs still in use is
+    within max_bytes, then deletes blobs no fetch points to.
+
+    Returns:
+        int: The number of removed fetches.
+    """
+    if not _initialized:
+        initialize_archive()
+    max_bytes = max_bytes or ARCHIVE_CONFIG['max_bytes']
+
+    conn = connect_archive()
+    cur = conn.cursor()
+    cur.execute("SELECT COALESCE(SUM(stored_size), 0) FROM html_blobs")
+    total = cur.fetchone()[0]
+    removed = 0
+    if total > max_bytes:
+        # Walk fetches from the newest and keep them while they fit; a blob shared by several fetches counts once
+        cur.execute("""
+            SELECT f.id, f.hash, b.stored_size FROM html_fetches f
+            JOIN html_blobs b ON f.hash = b.hash
+            ORDER BY f.fetched_unix DESC, f.id DESC
+        """)
+        kept = set()
+        size = 0
+        full = False
+        expired = set()
+        for fetch_id, content_hash, stored_size in cur.fetchall():
+            if content_hash in kept:
+                continue
+            if not full and size + stored_size <= max_bytes:
+                kept.add(content_hash)
+                size += stored_size
+            else:
+                full = True
+                expired.add(content_hash)
+        cur.executemany("DELETE FROM html_fetches WHERE hash = ?", [(content_hash,) for content_hash in expired])
+        removed = cur.rowcount
+        cur.execute("DELETE FROM html_blobs WHERE hash NOT IN (SELECT hash FROM html_fetches)")
+        conn.commit()
+        logging.info(f"Removed {removed} archived fetches to keep the HTML archive under {max_bytes} bytes.")
+    conn.close()
+
+    _count('evicted_fetches', removed)
+    return removed
+
+def get_archive_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    if not _initialized:
+        initialize_archive()
+    conn = connect_archive()
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(stored_size), 0) FROM html_blobs")
+    stats['blobs'], stats['raw_bytes'], stats['stored_bytes'] = cur.fetchone()
+    conn.close()
+    return stats
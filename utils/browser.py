@@ -1,34 +1,432 @@
 # utils/browser.py
 import os
+import queue
+import threading
+import time
 from selenium import webdriver
 from selenium.webdriver.firefox.options import Options
 from selenium.webdriver.firefox.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+import json
 import logging
+import params
+try:
+    import psutil
+except ImportError:
+    psutil = None
+from utils.metrics import observe, increment
+from utils.fetch import get_host, acquire_host, on_host_success
 
-def initialize_browser():
+BROWSER_POOL_CONFIG = params.get_browser_pool_config()
+BROWSER_PROFILE_CONFIG = params.get_browser_profile_config()
+LIFECYCLE_CONFIG = params.get_browser_lifecycle_config()
+CONSENT_CONFIG = params.get_consent_config()
+
+# Histogram buckets for page sizes, in bytes
+BYTES_BUCKETS = [10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000, 5_000_000, float('inf')]
+
+REJECT_BUTTON_SELECTOR = "button[name='reject']"
+
+# Idle pool entries; each entry holds a driver and its health state
+_idle_browsers = queue.Queue()
+_browsers = []
+_pool_lock = threading.Lock()
+# Pre-warmed driver that replaces a recycled one
+_spare = {'entry': None, 'building': False}
+_watchdog_stop = threading.Event()
+
+# Consent state per browser session id: 'rejected' or 'not_shown'
+CONSENT_STATE = {}
+
+def initialize_browser(headless=False):
     current_dir = os.getcwd()
-    
+
     # Path to geckodriver in the current directory
     geckodriver_path = os.path.join(current_dir, 'geckodriver')
 
     options = Options()
-    # options.add_argument('-headless')
+    if headless:
+        options.add_argument('-headless')
     options.set_preference('permissions.default.image', 2)
     options.set_preference('javascript.enabled', False)
     options.set_preference('media.autoplay.default', 5)
     options.set_preference('media.volume_scale', '0.0')
-    
+    if BROWSER_PROFILE_CONFIG['lean']:
+        apply_lean_profile(options)
+
     service = Service(executable_path=geckodriver_path)
     return webdriver.Firefox(service=service, options=options)
 
-def handle_cookie_consent(driver):
+def build_blocking_pac(first_party_domains):
+    # Proxy auto-config that sends every other host to a closed port, so it fails at once
+    return (
+        "function FindProxyForURL(url, host) {"
+        f" var allowed = {json.dumps(first_party_domains)};"
+        " for (var i = 0; i < allowed.length; i++) {"
+        "  if (host == allowed[i] || dnsDomainIs(host, '.' + allowed[i])) return 'DIRECT';"
+        " }"
+        " return 'PROXY 127.0.0.1:9';"
+        "}"
+    )
+
+def apply_lean_profile(options):
+    """
+    Stops Firefox from loading anything the extractors do not read, and returns from
+    driver.get before the full load event.
+    """
+    options.page_load_strategy = BROWSER_PROFILE_CONFIG['page_load_strategy']
+    if BROWSER_PROFILE_CONFIG['block_stylesheets']:
+        options.set_preference('permissions.default.stylesheet', 2)
+    if BROWSER_PROFILE_CONFIG['block_fonts']:
+        options.set_preference('gfx.downloadable_fonts.enabled', False)
+        options.set_preference('browser.display.use_document_fonts', 0)
+    if BROWSER_PROFILE_CONFIG['block_subframes']:
+        options.set_preference('permissions.default.subdocument', 2)
+    if BROWSER_PROFILE_CONFIG['block_third_party']:
+        options.set_preference('network.proxy.type', 2)
+        options.set_preference('network.proxy.autoconfig_url', 'data:text/javascript,' + build_blocking_pac(BROWSER_PROFILE_CONFIG['first_party_domains']))
+        options.set_preference('privacy.trackingprotection.enabled', True)
+        options.set_preference('network.cookie.cookieBehavior', 1)
+    options.set_preference('network.prefetch-next', False)
+    options.set_preference('network.dns.disablePrefetch', True)
+    options.set_preference('network.http.speculative-parallel-limit', 0)
+
+def get_transferred_bytes(driver):
+    # Bytes over the network for the page and its subresources; the page source length if timing data is unavailable
+    try:
+        transferred = driver.execute_script(
+            "return performance.getEntries().reduce((total, entry) => total + (entry.transferSize || 0), 0);"
+        )
+        if transferred:
+            return transferred
+    except Exception:
+        pass
+    return len(driver.page_source.encode('utf-8'))
+
+def load_page(driver, url, wait_selector=None):
+    """
+    Loads a page, handles the cookie consent and waits until the element the extractor
+    needs is present. Records the load time and transferred bytes per profile.
+
+    Parameters:
+        driver (webdriver.Firefox): The browser.
+        url (str): The page url.
+        wait_selector (str): CSS selector of the element to wait for, the body by default.
+
+    Returns:
+        bool: True if the element appeared before the wait timeout.
+    """
+    profile = 'lean' if BROWSER_PROFILE_CONFIG['lean'] else 'full'
+    # Browser loads count against the same per-host rate as plain HTTP fetches. Waiting
+    # for a throttled host can take minutes and is not a hang, so the watchdog's
+    # timer is stopped during the wait and restarted for the page load.
+    entry = get_pool_entry(driver)
+    if entry is not None:
+        entry['checked_out_since'] = None
+    acquire_host(get_host(url))
+    if entry is not None:
+        entry['checked_out_since'] = time.monotonic()
+    started = time.perf_counter()
+    try:
+        driver.get(url)
+    except TimeoutException:
+        # The page load timeout only stops loading; whatever arrived can still be extracted
+        increment('browser.page_load_timeouts')
+        logging.warning(f"Page load of {url} timed out after {LIFECYCLE_CONFIG['page_load_timeout']}s")
+    handle_cookie_consent(driver)
+    try:
+        wait = WebDriverWait(driver, BROWSER_PROFILE_CONFIG['wait_timeout'])
+        wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, wait_selector or 'body')))
+        found = True
+        on_host_success(get_host(url))
+    except TimeoutException:
+        logging.warning(f"Timed out waiting for '{wait_selector}' on {url}")
+        found = False
+    elapsed = time.perf_counter() - started
+    transferred = get_transferred_bytes(driver)
+    observe(f'browser.page_load.{profile}', elapsed)
+    observe(f'browser.page_bytes.{profile}', transferred, buckets=BYTES_BUCKETS)
+    logging.info(f"Loaded {url} with the {profile} profile in {elapsed:.2f}s, {transferred} bytes")
+    return found
+
+def create_pool_entry(browser_id):
+    driver = initialize_browser(headless=BROWSER_POOL_CONFIG['headless'])
+    driver.set_page_load_timeout(LIFECYCLE_CONFIG['page_load_timeout'])
+    driver.set_script_timeout(LIFECYCLE_CONFIG['script_timeout'])
+    prepare_consent(driver)
+    return {
+        'id': browser_id,
+        'driver': driver,
+        'healthy': True,
+        'failures': 0,
+        'pages': 0,
+        'created_unix': int(time.time()),
+        'last_used_unix': None,
+        'checked_out_since': None,
+        'killed': False,
+    }
+
+def start_browser_pool(size=None):
+    """
+    Starts the warm browser pool, its spare driver and the hang watchdog. Calling it
+    again while the pool is running is a no-op.
+
+    Parameters:
+        size (int): Number of drivers, BROWSER_POOL_CONFIG['size'] by default.
+    """
+    with _pool_lock:
+        if _browsers:
+            return
+        for browser_id in range(size or BROWSER_POOL_CONFIG['size']):
+            entry = create_pool_entry(browser_id)
+            _browsers.append(entry)
+            _idle_browsers.put(entry)
+    _watchdog_stop.clear()
+    threading.Thread(target=run_browser_watchdog, name="browser-watchdog", daemon=True).start()
+    ensure_spare_browser()
+    logging.info(f"Started browser pool with {len(_browsers)} drivers")
+
+def get_browser_pool_size():
+    return len(_browsers)
+
+def get_pool_entry(driver):
+    with _pool_lock:
+        for entry in _browsers:
+            if entry['driver'] is driver:
+                return entry
+    return None
+
+def is_browser_alive(driver):
+    # Any command fails once the session or geckodriver is gone
+    try:
+        driver.current_url
+        return True
+    except Exception:
+        return False
+
+def get_browser_rss(entry):
+    """
+    Returns:
+        int or None: Resident memory of geckodriver and its Firefox processes in bytes,
+        or None when psutil is not installed.
+    """
+    if psutil is None:
+        return None
     try:
-        wait = WebDriverWait(driver, 5)
-        reject_button = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "button[name='reject']")))
-        reject_button.click()
-        logging.info("Cookie consent handled.")
+        process = psutil.Process(entry['driver'].service.process.pid)
+        return sum(p.memory_info().rss for p in [process, *process.children(recursive=True)])
+    except (psutil.Error, AttributeError):
+        return None
+
+def kill_browser(entry):
+    # Kills the processes outright; used when the driver does not respond to quit
+    entry['killed'] = True
+    process = getattr(entry['driver'].service, 'process', None)
+    if process is None:
+        return
+    if psutil is not None:
+        try:
+            for child in psutil.Process(process.pid).children(recursive=True):
+                child.kill()
+        except psutil.Error:
+            pass
+    process.kill()
+
+def run_browser_watchdog():
+    # Kills drivers that stay checked out past hang_timeout, so the blocked call fails
+    # and return_browser replaces the driver
+    while not _watchdog_stop.wait(LIFECYCLE_CONFIG['watchdog_interval']):
+        now = time.monotonic()
+        with _pool_lock:
+            hung = [
+                entry for entry in _browsers
+                if entry['checked_out_since'] and not entry['killed']
+                and now - entry['checked_out_since'] > LIFECYCLE_CONFIG['hang_timeout']
+            ]
+        for entry in hung:
+            logging.error(f"Browser {entry['id']} hung for over {LIFECYCLE_CONFIG['hang_timeout']}s, killing it")
+            increment('browser.hung')
+            kill_browser(entry)
+
+def build_spare_browser():
+    entry = None
+    try:
+        entry = create_pool_entry(None)
+    except Exception as e:
+        logging.error(f"Failed to start a spare browser: {e}")
+    with _pool_lock:
+        _spare['entry'] = entry
+        _spare['building'] = False
+
+def ensure_spare_browser():
+    if not LIFECYCLE_CONFIG['prewarm']:
+        return
+    with _pool_lock:
+        if _spare['entry'] is not None or _spare['building']:
+            return
+        _spare['building'] = True
+    threading.Thread(target=build_spare_browser, name="browser-spare", daemon=True).start()
+
+def take_spare_browser():
+    with _pool_lock:
+        entry = _spare['entry']
+        _spare['entry'] = None
+    return entry
+
+def checkout_browser(timeout=None):
+    """
+    Takes a driver out of the pool, waiting until one is free. A driver whose session
+    died while idle is replaced first.
+
+    Returns:
+        dict: The pool entry; pass it back to return_browser when done.
+    """
+    if not _browsers:
+        start_browser_pool()
+    try:
+        entry = _idle_browsers.get(timeout=timeout or BROWSER_POOL_CONFIG['checkout_timeout'])
+    except queue.Empty:
+        raise TimeoutError("No browser became free in the pool")
+    if not is_browser_alive(entry['driver']):
+        entry = recycle_browser(entry, "dead session")
+    entry['last_used_unix'] = int(time.time())
+    entry['checked_out_since'] = time.monotonic()
+    return entry
+
+def get_recycle_reason(entry, success):
+    if entry['killed']:
+        return "hung"
+    if not success and not is_browser_alive(entry['driver']):
+        return "dead session"
+    if entry['failures'] >= BROWSER_POOL_CONFIG['max_failures']:
+        return f"{entry['failures']} failures in a row"
+    if entry['pages'] >= LIFECYCLE_CONFIG['max_pages']:
+        return f"{entry['pages']} pages"
+    rss = get_browser_rss(entry)
+    if rss is not None and rss > LIFECYCLE_CONFIG['max_rss_mb'] * 1024 ** 2:
+        return f"RSS of {rss / 1024 ** 2:.0f} MB"
+    return None
+
+def recycle_browser(entry, reason):
+    """
+    Replaces a pool entry with the pre-warmed spare, or a new driver when no spare is
+    ready, and quits the old driver in the background.
+
+    Returns:
+        dict: The replacement, or the old entry if no driver could be started.
+    """
+    logging.warning(f"Recycling browser {entry['id']}: {reason}")
+    increment('browser.recycled')
+    replacement = take_spare_browser()
+    if replacement is None:
+        try:
+            replacement = create_pool_entry(entry['id'])
+        except Exception as e:
+            # Keep the pool size; the next checkout retries with the old entry
+            logging.error(f"Failed to replace browser {entry['id']}: {e}")
+            return entry
+    replacement['id'] = entry['id']
+    entry['healthy'] = False
+    with _pool_lock:
+        if entry in _browsers:
+            _browsers[_browsers.index(entry)] = replacement
+    threading.Thread(target=quit_browser, args=(entry,), daemon=True).start()
+    ensure_spare_browser()
+    return replacement
+
+def return_browser(entry, success=True):
+    """
+    Puts a driver back into the pool. Hung, dead, repeatedly failing, worn out
+    (max_pages) and oversized (max_rss_mb) drivers are recycled first.
+    """
+    entry['checked_out_since'] = None
+    entry['pages'] += 1
+    entry['failures'] = 0 if success else entry['failures'] + 1
+    reason = get_recycle_reason(entry, success)
+    if reason:
+        entry = recycle_browser(entry, reason)
+    _idle_browsers.put(entry)
+
+def quit_browser(entry):
+    CONSENT_STATE.pop(entry['driver'].session_id, None)
+    try:
+        entry['driver'].quit()
+    except Exception as e:
+        logging.warning(f"Failed to quit browser {entry['id']}: {e}")
+
+def close_browser_pool():
+    _watchdog_stop.set()
+    spare = take_spare_browser()
+    with _pool_lock:
+        entries = list(_browsers) + ([spare] if spare else [])
+        _browsers.clear()
+        while not _idle_browsers.empty():
+            _idle_browsers.get_nowait()
+    for entry in entries:
+        quit_browser(entry)
+
+def get_browser_pool_stats():
+    with _pool_lock:
+        entries = list(_browsers)
+    stats = []
+    for entry in entries:
+        entry_stats = {key: entry[key] for key in ('id', 'healthy', 'failures', 'pages', 'created_unix', 'last_used_unix')}
+        rss = get_browser_rss(entry)
+        entry_stats['rss_mb'] = round(rss / 1024 ** 2) if rss is not None else None
+        stats.append(entry_stats)
+    return stats
+
+def click_reject_button(driver, timeout):
+    wait = WebDriverWait(driver, timeout)
+    reject_button = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, REJECT_BUTTON_SELECTOR)))
+    reject_button.click()
+
+def prepare_consent(driver):
+    """
+    Answers the cookie consent once for a new browser session: sets the configured
+    consent cookies, then loads the handshake page and rejects the dialog if it is shown.
+    """
+    started = time.perf_counter()
+    try:
+        if CONSENT_CONFIG['cookies']:
+            driver.get(CONSENT_CONFIG['handshake_url'])
+            for cookie in CONSENT_CONFIG['cookies']:
+                driver.add_cookie(cookie)
+        driver.get(CONSENT_CONFIG['handshake_url'])
+        try:
+            click_reject_button(driver, CONSENT_CONFIG['timeout'])
+            CONSENT_STATE[driver.session_id] = 'rejected'
+            logging.info("Cookie consent handled at browser startup.")
+        except Exception:
+            CONSENT_STATE[driver.session_id] = 'not_shown'
     except Exception as e:
-        logging.warning(f"Failed to handle cookie consent: {e}")
\ No newline at end of file
+        logging.warning(f"Cookie consent handshake failed: {e}")
+    observe('browser.consent_handshake', time.perf_counter() - started)
+
+def handle_cookie_consent(driver):
+    """
+    Rejects the cookie consent dialog if it is on the current page. Sessions that went
+    through the startup handshake only do a non-blocking check; unknown sessions wait
+    for the dialog once and remember the outcome.
+    """
+    started = time.perf_counter()
+    if driver.session_id in CONSENT_STATE:
+        reject_buttons = driver.find_elements(By.CSS_SELECTOR, REJECT_BUTTON_SELECTOR)
+        if reject_buttons:
+            try:
+                reject_buttons[0].click()
+                logging.info("Cookie consent handled.")
+            except Exception as e:
+                logging.warning(f"Failed to handle cookie consent: {e}")
+    else:
+        try:
+            click_reject_button(driver, CONSENT_CONFIG['timeout'])
+            CONSENT_STATE[driver.session_id] = 'rejected'
+            logging.info("Cookie consent handled.")
+        except Exception as e:
+            CONSENT_STATE[driver.session_id] = 'not_shown'
+            logging.warning(f"Failed to handle cookie consent: {e}")
+    observe('fetch.consent', time.perf_counter() - started)
@@ -0,0 +1,158 @@
+# utils/cache.py
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import params
+
+CACHE_CONFIG = params.get_score_cache_config()
+CACHE_DB_NAME = CACHE_CONFIG['db_name']
+
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+_stats_lock = threading.Lock()
+_initialized = False
+
+
+def _hash_text(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+        return _stats[name]
+
+def initialize_score_cache():
+    global _initialized
+    conn = sqlite3.connect(CACHE_DB_NAME)
+    cur = conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS score_cache (
+            cache_key TEXT PRIMARY KEY,
+            model_name TEXT,
+            value TEXT,
+            created_unix INTEGER,
+            last_access_unix INTEGER,
+            hits INTEGER DEFAULT 0
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_score_cache_last_access ON score_cache (last_access_unix)")
+    conn.commit()
+    conn.close()
+    _initialized = True
+
+def make_cache_key(model, system_prompt, message, overrides=None):
+    """
+    Builds the cache key for one scoring request.
+
+    Parameters:
+        model (dict): The model configuration dictionary.
+        system_prompt (str): The system prompt sent with the request.
+        message (str): The user message (article or tweet text).
+        overrides (dict): Extra request parameters that change the reply, if any.
+
+    Returns:
+        str: A hex digest over model name, model params, system prompt hash and message hash.
+    """
+    key = json.dumps([
+        model['name'],
+        {**model['params'], **(overrides or {})},
+        _hash_text(system_prompt),
+        _hash_text(message),
+    ], sort_keys=True)
+    return _hash_text(key)
+
+def get_cached_score(cache_key):
+    if not CACHE_CONFIG['enabled']:
+        return None
+    if not _initialized:
+        initialize_score_cache()
+
+    now = int(time.time())
+    conn = sqlite3.connect(CACHE_DB_NAME)
+    cur = conn.cursor()
+    cur.execute("SELECT value, created_unix FROM score_cache WHERE cache_key = ?", (cache_key,))
+    row = cur.fetchone()
+    value = None
+    if row and now - row[1] <= CACHE_CONFIG['ttl_seconds']:
+        value = json.loads(row[0])
+        cur.execute("""
+            UPDATE score_cache SET hits = hits + 1, last_access_unix = ? WHERE cache_key = ?
+        """, (now, cache_key))
+        conn.commit()
+    conn.close()
+
+    _count('hits' if value is not None else 'misses')
+    return value
+
+def store_cached_score(cache_key, model_name, value):
+    if not CACHE_CONFIG['enabled']:
+        return
+    if not _initialized:
+        initialize_score_cache()
+
+    now = int(time.time())
+    conn = sqlite3.connect(CACHE_DB_NAME)
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT OR REPLACE INTO score_cache (cache_key, model_name, value, created_unix, last_access_unix)
+        VALUES (?, ?, ?, ?, ?)
+    """, (cache_key, model_name, json.dumps(value), now, now))
+    conn.commit()
+    conn.close()
+
+    if _count('stores') % CACHE_CONFIG['evict_every'] == 0:
+        evict_score_cache()
+
+# The scoring coroutines share one event loop, so the blocking sqlite calls run in a
+# worker thread instead of stalling every in-flight request
+async def get_cached_score_async(cache_key):
+    if not CACHE_CONFIG['enabled']:
+        return None
+    return await asyncio.to_thread(get_cached_score, cache_key)
+
+async def store_cached_score_async(cache_key, model_name, value):
+    if not CACHE_CONFIG['enabled']:
+        return
+    await asyncio.to_thread(store_cached_score, cache_key, model_name, value)
+
+def evict_score_cache():
+    """
+    Removes expired entries, then the least recently used entries above the size limit.
+
+    Returns:
+        int: The number of evicted entries.
+    """
+    if not _initialized:
+        initialize_score_cache()
+
+    conn = sqlite3.connect(CACHE_DB_NAME)
+    cur = conn.cursor()
+    cur.execute("DELETE FROM score_cache WHERE created_unix < ?", (int(time.time()) - CACHE_CONFIG['ttl_seconds'],))
+    evicted = cur.rowcount
+    cur.execute("""
+        DELETE FROM score_cache WHERE cache_key IN (
+            SELECT cache_key FROM score_cache
+            ORDER BY last_access_unix DESC
+            LIMIT -1 OFFSET ?
+        )
+    """, (CACHE_CONFIG['max_entries'],))
+    evicted += cur.rowcount
+    conn.commit()
+    conn.close()
+
+    _count('evictions', evicted)
+    if evicted:
+        logging.info(f"Evicted {evicted} entries from the score cache.")
+    return evicted
+
+def get_cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
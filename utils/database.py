@@ -5,25 +5,123 @@ import sqlite3
 import time
 from dateutil import parser
 import params
+from utils.dedup import index_article
 
 DB_NAME = params.get_db_name()
 CRYPTO_KEYWORDS = params.get_crypto_keywords()
 MODELS = params.get_models()
+DISTILL_CONFIG = params.get_distill_config()
+HOST_RATE_CONFIG = params.get_host_rate_limit_config()
 
 NEWS_PROMPTS = params.get_news_prompts()
 TWITTER_PROMPTS = params.get_twitter_prompts()
 
+def get_model_table_name(crypto, model, data_type):
+    return f"{crypto}_{model['name'].replace('/', '_').replace('-', '_').replace('.', '_')}_{data_type}"
+
+def store_news_scores(cur, url, crypto, model, sentiment):
+    table_name = get_model_table_name(crypto, model, 'news')
+
+    # Convert aspect names to lowercase for column names
+    columns = ', '.join([f'"{key.lower().replace(" ", "_")}"' for key in sentiment.keys()])
+    placeholders = ', '.join(['?' for _ in sentiment])
+    values = tuple(sentiment.values())
+
+    cur.execute(f"""
+        INSERT OR REPLACE INTO "{table_name}"
+        (url, {columns})
+        VALUES (?, {placeholders})
+    """, (url, *values))
+
+def copy_news_scores(cur, source_url, url, crypto, model):
+    # Copies the stored scores of one article to another, e.g. for a near-duplicate
+    table_name = get_model_table_name(crypto, model, 'news')
+    cur.execute(f'PRAGMA table_info("{table_name}")')
+    columns = ', '.join(f'"{row[1]}"' for row in cur.fetchall() if row[1] != 'url')
+    cur.execute(f"""
+        INSERT OR REPLACE INTO "{table_name}" (url, {columns})
+        SELECT ?, {columns} FROM "{table_name}" WHERE url = ?
+    """, (url, source_url))
+    return cur.rowcount > 0
+
+def store_cascade_decisions(cur, item_type, item_id, crypto, decisions):
+    cur.executemany("""
+        INSERT OR REPLACE INTO scoring_cascade (item_type, item_id, crypto, aspect, models, reason)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, [
+        (item_type, item_id, crypto, aspect.lower().replace(' ', '_'), json.dumps(decision['models']), decision['reason'])
+        for aspect, decision in decisions.items()
+    ])
+
+def copy_cascade_decisions(cur, source_id, item_id, crypto):
+    cur.execute("""
+        INSERT OR REPLACE INTO scoring_cascade (item_type, item_id, crypto, aspect, models, reason)
+        SELECT item_type, ?, crypto, aspect, models, reason FROM scoring_cascade
+        WHERE item_type = 'news' AND item_id = ? AND crypto = ?
+    """, (item_id, source_id, crypto))
+
+def store_twitter_scores(cur, tweet, crypto, model, sentiment):
+    table_name = get_model_table_name(crypto, model, 'twitter')
+
+    columns = ', '.join([f'"{key.lower().replace(" ", "_")}"' for key in sentiment.keys()])
+    placeholders = ', '.join(['?' for _ in sentiment])
+    values = tuple(sentiment.values())
+
+    cur.execute(f"""
+        INSERT OR REPLACE INTO "{table_name}"
+        (tweet_id, author_id, text, created_at, {columns})
+        VALUES (?, ?, ?, ?, {placeholders})
+    """, (tweet['id'], tweet['author_id'], tweet['text'], tweet['created_at'], *values))
+
+def get_scored_models():
+    # LLM models plus the local distilled model, which writes provisional scores to its own tables
+    if DISTILL_CONFIG['enabled']:
+        return MODELS + [DISTILL_CONFIG['model']]
+    return MODELS
+
 def get_unscraped_links():
-    conn = sqlite3.connect(DB_NAME)
+    conn = sqlite3.connect(DB_NAME, timeout=30)
     cur = conn.cursor()
-    cur.execute("SELECT url FROM links WHERE is_scraped = 0")
+    cur.execute("""
+        SELECT url FROM links
+        WHERE is_scraped = 0 AND (next_attempt_unix IS NULL OR next_attempt_unix <= ?)
+    """, (int(time.time()),))
     links = [row[0] for row in cur.fetchall()]
     conn.close()
     return links
 
+def schedule_link_retry(url):
+    """
+    Leaves a throttled article unscraped and schedules its next fetch with an
+    exponentially growing delay. After max_attempts the link is given up (is_scraped = -1).
+
+    Returns:
+        int or None: The unix time of the next attempt, or None if the link was given up.
+    """
+    conn = sqlite3.connect(DB_NAME, timeout=30)
+    cur = conn.cursor()
+    cur.execute("SELECT COALESCE(retry_count, 0) FROM links WHERE url = ?", (url,))
+    row = cur.fetchone()
+    retry_count = (row[0] if row else 0) + 1
+    next_attempt_unix = None
+    if retry_count >= HOST_RATE_CONFIG['max_attempts']:
+        cur.execute("UPDATE links SET is_scraped = -1, retry_count = ? WHERE url = ?", (retry_count, url))
+        logging.error(f"Giving up on {url} after {retry_count} throttled attempts")
+    else:
+        delay = min(HOST_RATE_CONFIG['retry_base_delay'] * 2 ** (retry_count - 1), HOST_RATE_CONFIG['retry_max_delay'])
+        next_attempt_unix = int(time.time()) + delay
+        cur.execute("UPDATE links SET retry_count = ?, next_attempt_unix = ? WHERE url = ?", (retry_count, next_attempt_unix, url))
+        logging.warning(f"Fetch of {url} was throttled, retrying in {delay}s")
+    conn.commit()
+    conn.close()
+    return next_attempt_unix
+
 def initialize_database():
-    conn = sqlite3.connect(DB_NAME)
+    conn = sqlite3.connect(DB_NAME, timeout=30)
     cur = conn.cursor()
+    # The scraper, the scorer workers and the aggregation write concurrently; WAL lets
+    # readers go on during a write, and the mode is stored in the database file
+    cur.execute("PRAGMA journal_mode=WAL")
     
     # Create links and articles tables
     cur.execute("""
@@ -34,6 +132,12 @@ def initialize_database():
             is_scraped INTEGER DEFAULT 0
         )
     """)
+    # Retry schedule of articles whose fetch was throttled
+    for column_name in ('retry_count', 'next_attempt_unix'):
+        try:
+            cur.execute(f'ALTER TABLE links ADD COLUMN "{column_name}" INTEGER')
+        except sqlite3.OperationalError:
+            pass
     cur.execute("""
         CREATE TABLE IF NOT EXISTS articles (
             url TEXT PRIMARY KEY,
@@ -49,8 +153,8 @@ def initialize_database():
     
     # Create tables for each crypto type and model (for news)
     for crypto in CRYPTO_KEYWORDS.keys():
-        for model in MODELS:
-            table_name = f"{crypto}_{model['name'].replace('/', '_').replace('-', '_').replace('.', '_')}_news"
+        for model in get_scored_models():
+            table_name = get_model_table_name(crypto, model, 'news')
             cur.execute(f"""
                 CREATE TABLE IF NOT EXISTS "{table_name}" (
                     url TEXT PRIMARY KEY,
@@ -65,11 +169,18 @@ def initialize_database():
                     cur.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "{column_name}" INTEGER')
                 except sqlite3.OperationalError:
                     pass
+
+                # Expected score and confidence from logprob scoring
+                for suffix in ('expected', 'confidence'):
+                    try:
+                        cur.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "{column_name}_{suffix}" REAL')
+                    except sqlite3.OperationalError:
+                        pass
     
     # Create Twitter tables for each crypto type and model
     for crypto in CRYPTO_KEYWORDS.keys():
-        for model in MODELS:
-            table_name = f"{crypto}_{model['name'].replace('/', '_').replace('-', '_').replace('.', '_')}_twitter"
+        for model in get_scored_models():
+            table_name = get_model_table_name(crypto, model, 'twitter')
             cur.execute(f"""
                 CREATE TABLE IF NOT EXISTS "{table_name}" (
                     tweet_id TEXT PRIMARY KEY,
@@ -86,7 +197,71 @@ def initialize_database():
                     cur.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "{column_name}" INTEGER')
                 except sqlite3.OperationalError:
                     pass
+
+                # Expected score and confidence from logprob scoring
+                for suffix in ('expected', 'confidence'):
+                    try:
+                        cur.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "{column_name}_{suffix}" REAL')
+                    except sqlite3.OperationalError:
+                        pass
     
+    # MinHash index for near-duplicate article detection
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS article_minhash (
+            url TEXT PRIMARY KEY,
+            signature TEXT
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS article_minhash_bands (
+            band INTEGER,
+            bucket TEXT,
+            url TEXT
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_article_minhash_bands ON article_minhash_bands (band, bucket)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS article_duplicates (
+            url TEXT PRIMARY KEY,
+            duplicate_of TEXT,
+            similarity REAL,
+            detected_unix INTEGER
+        )
+    """)
+
+    # Models used per aspect by the scoring cascade
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS scoring_cascade (
+            item_type TEXT,
+            item_id TEXT,
+            crypto TEXT,
+            aspect TEXT,
+            models TEXT,
+            reason TEXT,
+            PRIMARY KEY (item_type, item_id, crypto, aspect)
+        )
+    """)
+
+    # Durable queue of (item, crypto, model) scoring jobs
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS scoring_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_type TEXT,
+            item_id TEXT,
+            crypto TEXT,
+            model TEXT,
+            state TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            lease_expires_unix INTEGER,
+            available_unix INTEGER DEFAULT 0,
+            last_error TEXT,
+            created_unix INTEGER,
+            updated_unix INTEGER,
+            UNIQUE (item_type, item_id, crypto, model)
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_scoring_jobs_state ON scoring_jobs (state, available_unix)")
+
     cur.execute("""
         CREATE TABLE IF NOT EXISTS twitter_data (
             tweet_id TEXT PRIMARY KEY,
@@ -102,22 +277,22 @@ def initialize_database():
     conn.close()
 
 def update_new_links(found_links):
-    conn = sqlite3.connect(DB_NAME)
+    conn = sqlite3.connect(DB_NAME, timeout=30)
     cur = conn.cursor()
 
     now = datetime.now(timezone.utc)
     now_unix = int(now.timestamp())
     
     new_links = []
+    # Link extractors only return article links, so every link is stored
     for link in found_links:
-        if ("/news/" in link) and (".html" in link) and ("https:" in link):
-            cur.execute("""
-                INSERT OR IGNORE INTO links (url, first_seen_utc, first_seen_unix)
-                VALUES (?, ?, ?)
-            """, (link, now, now_unix))
-            if cur.rowcount > 0:
-                logging.info(f"Added new link: {link}")
-                new_links.append(link)
+        cur.execute("""
+            INSERT OR IGNORE INTO links (url, first_seen_utc, first_seen_unix)
+            VALUES (?, ?, ?)
+        """, (link, now, now_unix))
+        if cur.rowcount > 0:
+            logging.info(f"Added new link: {link}")
+            new_links.append(link)
     
     conn.commit()
     conn.close()
@@ -125,10 +300,13 @@ def update_new_links(found_links):
     logging.info(f"Link scraping completed at {now}")
     return new_links
 
-def store_article(url, article_data):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    
+def build_article_row(url, article_data):
+    """
+    Converts extracted article data to the values of an articles row.
+
+    Returns:
+        tuple: (url, title, author, content, datetime_utc, datetime_unix, ticker_symbols)
+    """
     title = str(article_data.get('title')) if article_data.get('title') is not None else None
     author = str(article_data.get('author')) if article_data.get('author') is not None else None
     datetime_str = str(article_data.get('datetime')) if article_data.get('datetime') is not None else None
@@ -144,21 +322,72 @@ def store_article(url, article_data):
             datetime_unix = int(time.mktime(parsed_date.timetuple()))
         except ValueError:
             logging.warning(f"Invalid date format for URL {url}: {datetime_str}")    
+
+    return url, title, author, content, datetime_utc, datetime_unix, ticker_symbols
+
+def store_article(url, article_data):
+    # Articles are stored from several scraper threads at once
+    conn = sqlite3.connect(DB_NAME, timeout=30)
+    cur = conn.cursor()
+    
+    row = build_article_row(url, article_data)
+    _, title, author, content, datetime_utc, datetime_unix, ticker_symbols = row
     
     cur.execute("""
         INSERT OR REPLACE INTO articles (url, title, author, content, datetime_utc, datetime_unix, ticker_symbols)
         VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (url, title, author, content, datetime_utc, datetime_unix, ticker_symbols))
+    """, row)
     
     cur.execute("UPDATE links SET is_scraped = 1 WHERE url = ?", (url,))
+
+    index_article(cur, url, content)
     
     conn.commit()
     conn.close()
 
     return title, content, datetime_utc
 
+def update_articles(rows):
+    """
+    Bulk-updates existing articles, e.g. after re-extracting archived pages. Articles
+    whose content changed are re-indexed for near-duplicate detection.
+
+    Parameters:
+        rows (list of tuple): Rows from build_article_row.
+
+    Returns:
+        int: The number of articles whose stored values changed.
+    """
+    conn = sqlite3.connect(DB_NAME, timeout=30)
+    cur = conn.cursor()
+
+    existing = {}
+    urls = [row[0] for row in rows]
+    for i in range(0, len(urls), 500):
+        chunk = urls[i:i + 500]
+        cur.execute(f"""
+            SELECT url, title, author, content, datetime_utc, datetime_unix, ticker_symbols
+            FROM articles WHERE url IN ({', '.join('?' for _ in chunk)})
+        """, chunk)
+        existing.update({row[0]: row for row in cur.fetchall()})
+
+    changed = [row for row in rows if row[0] in existing and tuple(existing[row[0]]) != tuple(row)]
+    cur.executemany("""
+        UPDATE articles
+        SET title = ?, author = ?, content = ?, datetime_utc = ?, datetime_unix = ?, ticker_symbols = ?
+        WHERE url = ?
+    """, [(*row[1:], row[0]) for row in changed])
+
+    for row in changed:
+        if existing[row[0]][3] != row[3]:
+            index_article(cur, row[0], row[3])
+
+    conn.commit()
+    conn.close()
+    return len(changed)
+
 def store_twitter_data(tweets, crypto_name):
-    conn = sqlite3.connect(DB_NAME)
+    conn = sqlite3.connect(DB_NAME, timeout=30)
     cur = conn.cursor()
     
     for tweet in tweets:
@@ -0,0 +1,138 @@
+# utils/dedup.py
+
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+import params
+
+DEDUP_CONFIG = params.get_dedup_config()
+
+# Mersenne prime used for the MinHash permutations
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME))
+    for _ in range(DEDUP_CONFIG['num_perm'])
+]
+
+
+def get_shingles(text):
+    """
+    Splits text into overlapping word shingles after lowercasing and stripping punctuation.
+
+    Parameters:
+        text (str): The article content.
+
+    Returns:
+        set of str: The word shingles.
+    """
+    words = re.findall(r"\w+", text.lower())
+    size = DEDUP_CONFIG['shingle_size']
+    if len(words) < size:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _hash_shingle(shingle):
+    return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+
+def compute_minhash(text):
+    """
+    Computes the MinHash signature of a text.
+
+    Returns:
+        list of int: One minimum per permutation, or None if the text has no shingles.
+    """
+    hashes = [_hash_shingle(shingle) for shingle in get_shingles(text)]
+    if not hashes:
+        return None
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+def get_band_buckets(signature):
+    rows = DEDUP_CONFIG['num_perm'] // DEDUP_CONFIG['bands']
+    return [
+        (band, hashlib.blake2b(json.dumps(signature[band * rows:(band + 1) * rows]).encode('utf-8'), digest_size=8).hexdigest())
+        for band in range(DEDUP_CONFIG['bands'])
+    ]
+
+def estimate_similarity(signature, other):
+    return sum(1 for a, b in zip(signature, other) if a == b) / len(signature)
+
+def find_near_duplicate(cur, url, signature):
+    """
+    Looks up indexed articles sharing at least one LSH band with the signature and
+    returns the most similar one above the threshold.
+
+    Returns:
+        tuple: (original url, estimated similarity) or None.
+    """
+    candidates = set()
+    for band, bucket in get_band_buckets(signature):
+        cur.execute("SELECT url FROM article_minhash_bands WHERE band = ? AND bucket = ? AND url != ?", (band, bucket, url))
+        candidates.update(row[0] for row in cur.fetchall())
+
+    best = None
+    for candidate in candidates:
+        cur.execute("SELECT signature FROM article_minhash WHERE url = ?", (candidate,))
+        row = cur.fetchone()
+        if not row:
+            continue
+        similarity = estimate_similarity(signature, json.loads(row[0]))
+        if similarity >= DEDUP_CONFIG['threshold'] and (best is None or similarity > best[1]):
+            best = (candidate, similarity)
+
+    if best:
+        # Point at the first copy of the story rather than at another duplicate
+        cur.execute("SELECT duplicate_of FROM article_duplicates WHERE url = ?", (best[0],))
+        row = cur.fetchone()
+        if row:
+            best = (row[0], best[1])
+    return best
+
+def index_article(cur, url, content):
+    """
+    Adds an article to the MinHash index and records it as a near-duplicate when an
+    indexed article is similar enough.
+
+    Parameters:
+        cur (sqlite3.Cursor): The database cursor.
+        url (str): The article url.
+        content (str): The article content.
+
+    Returns:
+        tuple: (original url, estimated similarity) or None if the article is not a near-duplicate.
+    """
+    if not DEDUP_CONFIG['enabled'] or not content:
+        return None
+    if len(content.split()) < DEDUP_CONFIG['min_words']:
+        return None
+
+    signature = compute_minhash(content)
+    if signature is None:
+        return None
+
+    duplicate = find_near_duplicate(cur, url, signature)
+
+    cur.execute("DELETE FROM article_minhash_bands WHERE url = ?", (url,))
+    cur.execute("INSERT OR REPLACE INTO article_minhash (url, signature) VALUES (?, ?)", (url, json.dumps(signature)))
+    cur.executemany(
+        "INSERT INTO article_minhash_bands (band, bucket, url) VALUES (?, ?, ?)",
+        [(band, bucket, url) for band, bucket in get_band_buckets(signature)]
+    )
+
+    if duplicate:
+        cur.execute("""
+            INSERT OR REPLACE INTO article_duplicates (url, duplicate_of, similarity, detected_unix)
+            VALUES (?, ?, ?, ?)
+        """, (url, duplicate[0], duplicate[1], int(time.time())))
+        logging.info(f"Near-duplicate article {url} of {duplicate[0]} (similarity {duplicate[1]:.2f})")
+    else:
+        cur.execute("DELETE FROM article_duplicates WHERE url = ?", (url,))
+    return duplicate
+
+def get_duplicate_of(cur, url):
+    cur.execute("SELECT duplicate_of FROM article_duplicates WHERE url = ?", (url,))
+    row = cur.fetchone()
+    return row[0] if row else None
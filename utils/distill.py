@@ -0,0 +1,219 @@
+# utils/distill.py
+
+import logging
+import os
+import pickle
+import sqlite3
+import time
+
+try:
+    import numpy as np
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from sklearn.linear_model import Ridge
+except ImportError:
+    np = None
+
+import params
+from utils.database import get_model_table_name, store_news_scores, store_twitter_scores
+from utils.scoring import register_backend, get_prompts, build_article_message, build_tweet_message
+
+DB_NAME = params.get_db_name()
+MODELS = params.get_models()
+CRYPTO_KEYWORDS = params.get_crypto_keywords()
+DISTILL_CONFIG = params.get_distill_config()
+
+_scorers = {}
+_warned = {'unavailable': False}
+
+
+def is_distill_available():
+    # Provisional scoring is skipped, with one warning, when scikit-learn is not installed
+    if np is None and not _warned['unavailable']:
+        logging.warning("numpy or scikit-learn is not installed, distilled scoring is disabled")
+        _warned['unavailable'] = True
+    return np is not None
+
+def get_model_path(data_type):
+    return os.path.join(DISTILL_CONFIG['model_dir'], f"distilled_scorer_{data_type}.pkl")
+
+def get_vectorizer():
+    # Stateless, so training and inference build identical features without a fitted vocabulary
+    return HashingVectorizer(
+        n_features=DISTILL_CONFIG['n_features'],
+        ngram_range=(1, 2),
+        alternate_sign=False,
+        norm='l2',
+    )
+
+def build_features_text(message, crypto_name):
+    # The crypto is a feature so one regressor per aspect serves every crypto
+    return f"__crypto_{crypto_name.lower()}__ {message}"
+
+def load_training_data(cur, data_type):
+    """
+    Collects the LLM scores stored in the per-crypto, per-model tables and averages
+    them per item, crypto and aspect.
+
+    Parameters:
+        cur (sqlite3.Cursor): The database cursor.
+        data_type (str): Type of data ('news' or 'twitter').
+
+    Returns:
+        tuple: (list of feature texts, dict mapping aspect column to a list of targets
+        aligned with the texts, NaN where no model scored the aspect).
+    """
+    prompts = get_prompts(data_type == 'twitter')
+    aspects = [prompt['aspect'].lower().replace(' ', '_') for prompt in prompts]
+    columns = ', '.join(f'COALESCE(t."{aspect}_expected", t."{aspect}")' for aspect in aspects)
+
+    samples = {}
+    for crypto in CRYPTO_KEYWORDS.keys():
+        for model in MODELS:
+            table = get_model_table_name(crypto, model, data_type)
+            cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
+            if not cur.fetchone():
+                continue
+            if data_type == 'news':
+                cur.execute(f"""
+                    SELECT t.url, a.title, a.content, {columns}
+                    FROM "{table}" t JOIN articles a ON t.url = a.url
+                """)
+                rows = [(row[0], build_article_message(row[1], row[2]), row[3:]) for row in cur.fetchall()]
+            else:
+                cur.execute(f'SELECT t.tweet_id, t.text, {columns} FROM "{table}" t')
+                rows = [(row[0], build_tweet_message(row[1]), row[2:]) for row in cur.fetchall()]
+
+            for item_id, message, scores in rows:
+                sample = samples.setdefault((item_id, crypto), {
+                    'text': build_features_text(message, crypto),
+                    'scores': {aspect: [] for aspect in aspects},
+                })
+                for aspect, score in zip(aspects, scores):
+                    if score is not None:
+                        sample['scores'][aspect].append(score)
+
+    texts = [sample['text'] for sample in samples.values()]
+    targets = {
+        aspect: [float(np.mean(sample['scores'][aspect])) if sample['scores'][aspect] else np.nan for sample in samples.values()]
+        for aspect in aspects
+    }
+    return texts, targets
+
+def train_distilled_scorer(data_type='news'):
+    """
+    Fits one ridge regressor per aspect on hashed text features and saves them next to the database.
+
+    Parameters:
+        data_type (str): Type of data ('news' or 'twitter').
+
+    Returns:
+        dict: Mapping of aspect column to the number of training samples used.
+    """
+    if not is_distill_available():
+        return {}
+    conn = sqlite3.connect(DB_NAME, timeout=30)
+    cur = conn.cursor()
+    texts, targets = load_training_data(cur, data_type)
+    conn.close()
+
+    if not texts:
+        logging.warning(f"No stored {data_type} scores to train the distilled scorer on.")
+        return {}
+
+    started = time.perf_counter()
+    features = get_vectorizer().transform(texts)
+    regressors = {}
+    counts = {}
+    for aspect, values in targets.items():
+        values = np.array(values)
+        mask = ~np.isnan(values)
+        counts[aspect] = int(mask.sum())
+        if counts[aspect] < DISTILL_CONFIG['min_samples']:
+            logging.warning(f"Only {counts[aspect]} labelled {data_type} items for '{aspect}', skipping.")
+            continue
+        regressor = Ridge(alpha=DISTILL_CONFIG['alpha'])
+        regressor.fit(features[mask], values[mask])
+        regressors[aspect] = regressor
+
+    with open(get_model_path(data_type), 'wb') as f:
+        pickle.dump({'regressors': regressors, 'trained_unix': int(time.time()), 'counts': counts}, f)
+    _scorers.pop(data_type, None)
+
+    logging.info(f"Trained distilled {data_type} scorer on {len(texts)} items in {time.perf_counter() - started:.1f}s: {counts}")
+    return counts
+
+def load_distilled_scorer(data_type):
+    # Reloaded when the model file changes, e.g. after a retraining run in another process
+    path = get_model_path(data_type)
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    cached = _scorers.get(data_type)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            _scorers[data_type] = (mtime, pickle.load(f))
+    return _scorers[data_type][1]
+
+def score_message_local(message, crypto_name, is_twitter=False):
+    """
+    Scores every aspect with the distilled regressors.
+
+    Returns:
+        dict: Mapping of aspect name to the rounded score, plus '<aspect>_expected' with the
+        continuous prediction. Aspects without a trained regressor are left out.
+    """
+    if not is_distill_available():
+        return {}
+    scorer = load_distilled_scorer('twitter' if is_twitter else 'news')
+    if scorer is None:
+        return {}
+
+    features = get_vectorizer().transform([build_features_text(message, crypto_name)])
+    scores = {}
+    for prompt in get_prompts(is_twitter):
+        regressor = scorer['regressors'].get(prompt['aspect'].lower().replace(' ', '_'))
+        if regressor is None:
+            continue
+        expected = float(np.clip(regressor.predict(features)[0], 1, 10))
+        scores[prompt['aspect']] = int(round(expected))
+        scores[f"{prompt['aspect']}_expected"] = expected
+    return scores
+
+async def score_local_backend(message, model, crypto_name, is_twitter=False, fallback=True):
+    scores = score_message_local(message, crypto_name, is_twitter)
+    if not scores and not fallback:
+        raise LookupError("Distilled scorer is not trained or scikit-learn is not installed")
+    return scores
+
+def store_provisional_news_scores(url, title, content, crypto_types):
+    # Scores a freshly stored article locally while its LLM scoring jobs are pending
+    if not DISTILL_CONFIG['enabled'] or not is_distill_available():
+        return
+    message = build_article_message(title, content)
+    conn = sqlite3.connect(DB_NAME, timeout=30)
+    cur = conn.cursor()
+    for crypto_type in crypto_types:
+        scores = score_message_local(message, crypto_type)
+        if scores:
+            store_news_scores(cur, url, crypto_type, DISTILL_CONFIG['model'], scores)
+    conn.commit()
+    conn.close()
+
+def store_provisional_twitter_scores(tweets, crypto_name):
+    if not DISTILL_CONFIG['enabled'] or not is_distill_available():
+        return
+    conn = sqlite3.connect(DB_NAME, timeout=30)
+    cur = conn.cursor()
+    for tweet in tweets:
+        scores = score_message_local(build_tweet_message(tweet['text']), crypto_name, is_twitter=True)
+        if scores:
+            store_twitter_scores(cur, tweet, crypto_name, DISTILL_CONFIG['model'], scores)
+    conn.commit()
+    conn.close()
+
+register_backend('local', score_local_backend)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    train_distilled_scorer('news')
+    train_distilled_scorer('twitter')
@@ -0,0 +1,248 @@
+# utils/fetch.py
+
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import params
+from utils.metrics import observe, increment
+
+FETCH_CONFIG = params.get_fetch_config()
+HOST_RATE_CONFIG = params.get_host_rate_limit_config()
+
+# Status codes that mean the host is throttling us
+RATE_LIMIT_STATUSES = (429, 503)
+
+_session = None
+_session_lock = threading.Lock()
+_host_semaphores = {}
+# Token bucket and backoff state per host
+_host_limiters = {}
+
+
+def get_session():
+    """
+    Returns the shared requests session. Its connection pool keeps connections
+    alive between fetches, so repeated requests to the same host skip the TCP
+    and TLS handshakes.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=FETCH_CONFIG['pool_connections'],
+                pool_maxsize=FETCH_CONFIG['pool_maxsize'],
+            )
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+            _session.headers.update({
+                'User-Agent': FETCH_CONFIG['user_agent'],
+                'Accept': 'text/html,application/xhtml+xml',
+                'Accept-Language': 'en-US,en;q=0.5',
+            })
+    return _session
+
+def get_host(url):
+    return urlparse(url).netloc
+
+def get_host_semaphore(host):
+    with _session_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(FETCH_CONFIG['max_per_host'])
+        return _host_semaphores[host]
+
+def get_host_limiter(host):
+    with _session_lock:
+        if host not in _host_limiters:
+            _host_limiters[host] = {
+                'lock': threading.Lock(),
+                'rate': HOST_RATE_CONFIG['requests_per_second'],
+                'tokens': float(HOST_RATE_CONFIG['burst']),
+                'last_refill': time.monotonic(),
+                'blocked_until': 0.0,
+                'backoff': HOST_RATE_CONFIG['base_backoff'],
+                'requests': 0,
+                'throttle_events': 0,
+            }
+        return _host_limiters[host]
+
+def _refill(limiter):
+    now = time.monotonic()
+    limiter['tokens'] = min(float(HOST_RATE_CONFIG['burst']), limiter['tokens'] + (now - limiter['last_refill']) * limiter['rate'])
+    limiter['last_refill'] = now
+
+def get_host_backoff(url):
+    """
+    Returns:
+        float: Seconds until the host of a url may be fetched again after a rate-limit signal, 0 if it is not paused.
+    """
+    limiter = get_host_limiter(get_host(url))
+    with limiter['lock']:
+        return max(0.0, limiter['blocked_until'] - time.monotonic())
+
+def is_host_paused(url):
+    # Paused for longer than a fetch worker should wait
+    return get_host_backoff(url) > HOST_RATE_CONFIG['max_wait']
+
+def acquire_host(host):
+    """
+    Waits until the host's token bucket allows another request and it is not paused.
+    """
+    limiter = get_host_limiter(host)
+    while True:
+        with limiter['lock']:
+            _refill(limiter)
+            now = time.monotonic()
+            if now < limiter['blocked_until']:
+                wait = limiter['blocked_until'] - now
+            elif limiter['tokens'] >= 1:
+                limiter['tokens'] -= 1
+                limiter['requests'] += 1
+                return
+            else:
+                wait = (1 - limiter['tokens']) / limiter['rate']
+        time.sleep(wait)
+
+def on_host_success(host):
+    # Additive increase back towards the configured rate
+    limiter = get_host_limiter(host)
+    with limiter['lock']:
+        limiter['rate'] = min(HOST_RATE_CONFIG['requests_per_second'], limiter['rate'] + HOST_RATE_CONFIG['increase_step'])
+        if time.monotonic() >= limiter['blocked_until']:
+            limiter['backoff'] = HOST_RATE_CONFIG['base_backoff']
+
+def on_host_rate_limited(host, retry_after=None):
+    """
+    Pauses every request to a host after a rate-limit signal (a 429/503 response or a
+    throttling page) and halves its request rate. Signals that arrive while the host is
+    already paused, e.g. from requests that were in flight, do not extend the pause.
+    """
+    limiter = get_host_limiter(host)
+    with limiter['lock']:
+        now = time.monotonic()
+        limiter['throttle_events'] += 1
+        if now < limiter['blocked_until']:
+            return
+        delay = retry_after if retry_after is not None else limiter['backoff']
+        limiter['blocked_until'] = now + delay
+        limiter['backoff'] = min(limiter['backoff'] * 2, HOST_RATE_CONFIG['max_backoff'])
+        limiter['rate'] = max(HOST_RATE_CONFIG['min_requests_per_second'], limiter['rate'] * HOST_RATE_CONFIG['decrease_factor'])
+        limiter['tokens'] = 0.0
+        rate = limiter['rate']
+    increment('fetch.throttled')
+    logging.warning(f"Rate limited by {host}, pausing for {delay:.0f}s and lowering the rate to {rate:.2f} requests/s")
+
+def get_retry_after(response):
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def get_host_rate_stats():
+    stats = {}
+    with _session_lock:
+        limiters = dict(_host_limiters)
+    for host, limiter in limiters.items():
+        with limiter['lock']:
+            stats[host] = {
+                'rate': round(limiter['rate'], 3),
+                'paused_for': round(max(0.0, limiter['blocked_until'] - time.monotonic()), 1),
+                'requests': limiter['requests'],
+                'throttle_events': limiter['throttle_events'],
+            }
+    return stats
+
+def fetch_page(url, headers=None):
+    """
+    Fetches a page over plain HTTP, limited to max_per_host concurrent requests and the
+    token bucket rate per host.
+
+    Parameters:
+        url (str): The page url.
+        headers (dict): Extra request headers.
+
+    Returns:
+        requests.Response or None: The response, or None if the request failed.
+    """
+    if not FETCH_CONFIG['enabled']:
+        return None
+
+    host = get_host(url)
+    acquire_host(host)
+    with get_host_semaphore(host):
+        started = time.perf_counter()
+        try:
+            response = get_session().get(url, headers=headers, timeout=FETCH_CONFIG['timeout'])
+        except requests.RequestException as e:
+            increment('fetch.http.errors')
+            logging.warning(f"HTTP fetch failed for {url}: {e}")
+            return None
+        finally:
+            observe('fetch.http', time.perf_counter() - started)
+
+    increment(f'fetch.http.status.{response.status_code}')
+    if response.status_code in RATE_LIMIT_STATUSES:
+        on_host_rate_limited(host, get_retry_after(response))
+    elif response.status_code < 400:
+        on_host_success(host)
+    return response
+
+def fetch_html(url):
+    """
+    Fetches a page and returns its HTML.
+
+    Returns:
+        str or None: The page HTML, or None if the request failed.
+    """
+    response = fetch_page(url)
+    if response is None:
+        return None
+    if response.status_code != 200:
+        logging.warning(f"HTTP fetch for {url} returned status {response.status_code}")
+        return None
+    return response.text
+
+def fetch_html_if_modified(url, validators):
+    """
+    Conditional GET with the ETag and Last-Modified values of the previous response.
+
+    Parameters:
+        url (str): The page url.
+        validators (dict): 'etag' and 'last_modified' from the previous call, may be empty.
+
+    Returns:
+        tuple: (html, validators, not_modified). html is None when the page is unchanged
+        (not_modified is True) or the request failed.
+    """
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+
+    response = fetch_page(url, headers)
+    if response is None:
+        return None, validators, False
+    if response.status_code == 304:
+        return None, validators, True
+    if response.status_code != 200:
+        logging.warning(f"HTTP fetch for {url} returned status {response.status_code}")
+        return None, validators, False
+    return response.text, {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }, False
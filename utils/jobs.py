@@ -0,0 +1,391 @@
+# utils/jobs.py
+
+import asyncio
+import concurrent.futures
+import logging
+import sqlite3
+import threading
+import time
+import params
+from utils.database import store_news_scores, store_twitter_scores, store_cascade_decisions, copy_news_scores, copy_cascade_decisions
+from utils.dedup import get_duplicate_of
+from utils.scoring import get_event_loop, score_message, score_message_cascade, score_message_multi_crypto, build_article_message, build_tweet_message
+from utils.cache import get_cache_stats
+from utils.ratelimit import get_rate_limit_stats
+
+DB_NAME = params.get_db_name()
+MODELS = params.get_models()
+JOBS_CONFIG = params.get_scoring_jobs_config()
+CASCADE_CONFIG = params.get_cascade_config()
+SCORING_CONFIG = params.get_scoring_config()
+DEDUP_CONFIG = params.get_dedup_config()
+
+# Model name of jobs that score an item through the whole model cascade
+CASCADE_MODEL = 'cascade'
+
+
+def connect_jobs_database():
+    # Scorer workers and the scraper write concurrently, so wait on locks instead of failing
+    return sqlite3.connect(DB_NAME, timeout=30)
+
+def get_models_by_name():
+    return {model['name']: model for model in MODELS}
+
+def get_job_models():
+    # In cascade mode one job covers all models, which are chosen while scoring
+    if CASCADE_CONFIG['enabled']:
+        return [{'name': CASCADE_MODEL}]
+    return MODELS
+
+def enqueue_scoring_jobs(item_type, item_id, cryptos, models=None):
+    """
+    Queues one scoring job per (crypto, model) for an article or tweet. Jobs that
+    already exist, including finished ones, are left untouched.
+
+    Parameters:
+        item_type (str): 'news' or 'twitter'.
+        item_id (str): The article url or tweet id.
+        cryptos (list of str): The cryptocurrencies the item is scored for.
+        models (list of dict): Model configurations, one job per configured model (or a
+            single cascade job in cascade mode) by default.
+
+    Returns:
+        int: The number of newly queued jobs.
+    """
+    now = int(time.time())
+    conn = connect_jobs_database()
+    cur = conn.cursor()
+    queued = 0
+    for crypto in cryptos:
+        for model in get_job_models() if models is None else models:
+            cur.execute("""
+                INSERT OR IGNORE INTO scoring_jobs (item_type, item_id, crypto, model, created_unix, updated_unix)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (item_type, item_id, crypto, model['name'], now, now))
+            queued += cur.rowcount
+    conn.commit()
+    conn.close()
+    return queued
+
+def claim_scoring_jobs(limit):
+    """
+    Leases up to `limit` runnable jobs: pending jobs whose retry delay has passed and
+    leased jobs whose lease expired because their worker died.
+
+    Returns:
+        list of dict: The claimed jobs.
+    """
+    now = int(time.time())
+    conn = connect_jobs_database()
+    conn.isolation_level = None
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute("""
+            SELECT id, item_type, item_id, crypto, model, attempts
+            FROM scoring_jobs
+            WHERE (state = 'pending' AND available_unix <= ?)
+               OR (state = 'leased' AND lease_expires_unix < ?)
+            ORDER BY id
+            LIMIT ?
+        """, (now, now, limit))
+        columns = [column[0] for column in cur.description]
+        jobs = [dict(zip(columns, row)) for row in cur.fetchall()]
+
+        if SCORING_CONFIG['multi_crypto'] and jobs:
+            # Claim the other cryptos' jobs for the same items so they share one request
+            items = list({(job['item_type'], job['item_id']) for job in jobs})
+            job_ids = [job['id'] for job in jobs]
+            cur.execute(f"""
+                SELECT id, item_type, item_id, crypto, model, attempts
+                FROM scoring_jobs
+                WHERE state = 'pending' AND available_unix <= ?
+                  AND ({' OR '.join('(item_type = ? AND item_id = ?)' for _ in items)})
+                  AND id NOT IN ({', '.join('?' for _ in job_ids)})
+            """, (now, *[value for item in items for value in item], *job_ids))
+            jobs.extend(dict(zip(columns, row)) for row in cur.fetchall())
+
+        cur.executemany("""
+            UPDATE scoring_jobs
+            SET state = 'leased', attempts = attempts + 1, lease_expires_unix = ?, updated_unix = ?
+            WHERE id = ?
+        """, [(now + JOBS_CONFIG['lease_seconds'], now, job['id']) for job in jobs])
+        cur.execute("COMMIT")
+    except Exception:
+        cur.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    for job in jobs:
+        job['attempts'] += 1
+    return jobs
+
+def extend_job_leases(jobs):
+    now = int(time.time())
+    conn = connect_jobs_database()
+    cur = conn.cursor()
+    cur.executemany("""
+        UPDATE scoring_jobs SET lease_expires_unix = ?, updated_unix = ? WHERE id = ? AND state = 'leased'
+    """, [(now + JOBS_CONFIG['lease_seconds'], now, job['id']) for job in jobs])
+    conn.commit()
+    conn.close()
+
+def run_with_lease_renewal(coro, jobs):
+    """
+    Runs a batch on the scoring loop and renews the jobs' leases while it runs, so a
+    batch that takes longer than one lease is not reclaimed and scored again by
+    another worker.
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+    while True:
+        try:
+            return future.result(timeout=JOBS_CONFIG['lease_seconds'] / 3)
+        except concurrent.futures.TimeoutError:
+            extend_job_leases(jobs)
+
+def complete_scoring_job(cur, job_id):
+    cur.execute("""
+        UPDATE scoring_jobs SET state = 'done', last_error = NULL, updated_unix = ? WHERE id = ?
+    """, (int(time.time()), job_id))
+
+def fail_scoring_job(cur, job, error):
+    # Retry with exponential delay until the attempt limit is reached
+    now = int(time.time())
+    if job['attempts'] >= JOBS_CONFIG['max_attempts']:
+        cur.execute("""
+            UPDATE scoring_jobs SET state = 'failed', last_error = ?, updated_unix = ? WHERE id = ?
+        """, (str(error), now, job['id']))
+        logging.error(f"Scoring job {job['id']} failed permanently after {job['attempts']} attempts: {error}")
+    else:
+        delay = JOBS_CONFIG['retry_delay'] * 2 ** (job['attempts'] - 1)
+        cur.execute("""
+            UPDATE scoring_jobs SET state = 'pending', available_unix = ?, last_error = ?, updated_unix = ? WHERE id = ?
+        """, (now + delay, str(error), now, job['id']))
+        logging.warning(f"Scoring job {job['id']} failed, retrying in {delay}s: {error}")
+
+def defer_scoring_job(cur, job):
+    # Puts a claimed job back without counting the attempt
+    now = int(time.time())
+    cur.execute("""
+        UPDATE scoring_jobs SET state = 'pending', attempts = attempts - 1, available_unix = ?, updated_unix = ? WHERE id = ?
+    """, (now + JOBS_CONFIG['retry_delay'], now, job['id']))
+
+def copy_original_scores(cur, duplicate_of, job, models_by_name):
+    if job['model'] == CASCADE_MODEL:
+        # The cascade only scores with some of the models, so any copied row is a full copy
+        copied = [model for model in MODELS if copy_news_scores(cur, duplicate_of, job['item_id'], job['crypto'], model)]
+        if copied:
+            copy_cascade_decisions(cur, duplicate_of, job['item_id'], job['crypto'])
+        return bool(copied)
+    model = models_by_name.get(job['model'])
+    return model is not None and copy_news_scores(cur, duplicate_of, job['item_id'], job['crypto'], model)
+
+def is_original_job_queued(cur, duplicate_of, job):
+    cur.execute("""
+        SELECT 1 FROM scoring_jobs
+        WHERE item_type = 'news' AND item_id = ? AND crypto = ? AND model = ? AND state IN ('pending', 'leased')
+    """, (duplicate_of, job['crypto'], job['model']))
+    return cur.fetchone() is not None
+
+def resolve_duplicate_jobs(cur, jobs, models_by_name):
+    """
+    Completes the claimed jobs of near-duplicate articles with their original's
+    scores. The original may still have been queued when the duplicate was stored,
+    so this is checked again when the jobs are claimed, and a duplicate whose
+    original is still queued waits for it instead of being scored separately.
+
+    Returns:
+        list of dict: The jobs that still have to be scored.
+    """
+    if not DEDUP_CONFIG['copy_scores']:
+        return jobs
+    remaining = []
+    for job in jobs:
+        duplicate_of = get_duplicate_of(cur, job['item_id']) if job['item_type'] == 'news' else None
+        if not duplicate_of:
+            remaining.append(job)
+        elif copy_original_scores(cur, duplicate_of, job, models_by_name):
+            complete_scoring_job(cur, job['id'])
+            logging.info(f"Copied {job['crypto']} scores of {duplicate_of} for model {job['model']} to near-duplicate article {job['item_id']}")
+        elif is_original_job_queued(cur, duplicate_of, job):
+            defer_scoring_job(cur, job)
+        else:
+            remaining.append(job)
+    return remaining
+
+def load_job_items(cur, jobs):
+    """
+    Loads the article and tweet rows referenced by a batch of jobs.
+
+    Returns:
+        dict: Mapping of (item_type, item_id) to the item row as a dict.
+    """
+    items = {}
+    for item_type, query in (
+        ('news', "SELECT url AS id, title, content FROM articles WHERE url IN ({})"),
+        ('twitter', "SELECT tweet_id AS id, author_id, text, created_at FROM twitter_data WHERE tweet_id IN ({})"),
+    ):
+        item_ids = list({job['item_id'] for job in jobs if job['item_type'] == item_type})
+        if not item_ids:
+            continue
+        cur.execute(query.format(', '.join('?' for _ in item_ids)), item_ids)
+        columns = [column[0] for column in cur.description]
+        for row in cur.fetchall():
+            item = dict(zip(columns, row))
+            items[(item_type, item['id'])] = item
+    return items
+
+def build_job_message(job, item):
+    if job['item_type'] == 'twitter':
+        return build_tweet_message(item['text'])
+    return build_article_message(item['title'], item['content'])
+
+async def score_jobs_async(jobs, items, models_by_name):
+    async def score_job(job):
+        item = items.get((job['item_type'], job['item_id']))
+        if item is None:
+            raise LookupError(f"{job['item_type']} item not found: {job['item_id']}")
+        message = build_job_message(job, item)
+        is_twitter = job['item_type'] == 'twitter'
+        if job['model'] == CASCADE_MODEL:
+            return await score_message_cascade(message, MODELS, job['crypto'], is_twitter, fallback=False)
+
+        model = models_by_name.get(job['model'])
+        if model is None:
+            raise LookupError(f"Model not configured: {job['model']}")
+        sentiment = await score_message(message, model, job['crypto'], is_twitter, fallback=False)
+        return {model['name']: sentiment}, None
+
+    async def score_group(group):
+        # One request per model covers every crypto of the item; results fan out per job
+        job = group[0]
+        item = items.get((job['item_type'], job['item_id']))
+        if item is None:
+            raise LookupError(f"{job['item_type']} item not found: {job['item_id']}")
+        model = models_by_name.get(job['model'])
+        if model is None:
+            raise LookupError(f"Model not configured: {job['model']}")
+        scores = await score_message_multi_crypto(
+            build_job_message(job, item), model, [group_job['crypto'] for group_job in group],
+            job['item_type'] == 'twitter', fallback=False
+        )
+        return [({model['name']: scores[group_job['crypto']]}, None) for group_job in group]
+
+    groups = group_multi_crypto_jobs(jobs)
+    outcomes = await asyncio.gather(*[
+        score_group(group) if len(group) > 1 else score_job(group[0])
+        for group in groups
+    ], return_exceptions=True)
+
+    results = {}
+    for group, outcome in zip(groups, outcomes):
+        if len(group) > 1 and not isinstance(outcome, Exception):
+            results.update({job['id']: result for job, result in zip(group, outcome)})
+        else:
+            results.update({job['id']: outcome for job in group})
+    return [results[job['id']] for job in jobs]
+
+def group_multi_crypto_jobs(jobs):
+    """
+    Groups jobs that score the same item with the same model for different cryptos,
+    so they can share one multi-crypto request. Without multi-crypto scoring, and for
+    cascade jobs, every job is its own group.
+
+    Returns:
+        list of list of dict: The job groups.
+    """
+    if not SCORING_CONFIG['multi_crypto']:
+        return [[job] for job in jobs]
+    groups = {}
+    for job in jobs:
+        if job['model'] == CASCADE_MODEL:
+            groups[('job', job['id'])] = [job]
+        else:
+            groups.setdefault((job['item_type'], job['item_id'], job['model']), []).append(job)
+    return list(groups.values())
+
+def process_scoring_jobs(jobs):
+    """
+    Scores a batch of claimed jobs concurrently, then stores each result and marks
+    its job done in the same transaction.
+    """
+    models_by_name = get_models_by_name()
+    conn = connect_jobs_database()
+    cur = conn.cursor()
+    jobs = resolve_duplicate_jobs(cur, jobs, models_by_name)
+    conn.commit()
+    items = load_job_items(cur, jobs)
+
+    results = run_with_lease_renewal(score_jobs_async(jobs, items, models_by_name), jobs)
+
+    for job, result in zip(jobs, results):
+        if isinstance(result, Exception):
+            fail_scoring_job(cur, job, result)
+            conn.commit()
+            continue
+        try:
+            scores, decisions = result
+            for model_name, sentiment in scores.items():
+                model = models_by_name[model_name]
+                if job['item_type'] == 'twitter':
+                    store_twitter_scores(cur, items[('twitter', job['item_id'])], job['crypto'], model, sentiment)
+                else:
+                    store_news_scores(cur, job['item_id'], job['crypto'], model, sentiment)
+            if decisions:
+                store_cascade_decisions(cur, job['item_type'], job['item_id'], job['crypto'], decisions)
+            complete_scoring_job(cur, job['id'])
+            conn.commit()
+            logging.info(f"Processed and stored {job['crypto']} {job['item_type']} item for model {job['model']}: {job['item_id']}")
+        except Exception as e:
+            conn.rollback()
+            fail_scoring_job(cur, job, e)
+            conn.commit()
+    conn.close()
+
+def drain_scoring_jobs(max_batches=None):
+    """
+    Claims and processes job batches until the queue has no runnable jobs.
+
+    Returns:
+        int: The number of processed jobs.
+    """
+    processed = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        jobs = claim_scoring_jobs(JOBS_CONFIG['batch_size'])
+        if not jobs:
+            break
+        process_scoring_jobs(jobs)
+        processed += len(jobs)
+        batches += 1
+    return processed
+
+def run_scoring_worker(stop_event):
+    while not stop_event.is_set():
+        try:
+            processed = drain_scoring_jobs(max_batches=1)
+        except Exception as e:
+            logging.error(f"Scoring worker error: {e}")
+            processed = 0
+        if processed:
+            logging.info(f"Score cache stats: {get_cache_stats()}")
+            logging.info(f"Rate limiter stats: {get_rate_limit_stats()}")
+        else:
+            stop_event.wait(JOBS_CONFIG['poll_interval'])
+
+def start_scoring_workers(stop_event, workers=None):
+    threads = []
+    for i in range(workers or JOBS_CONFIG['workers']):
+        thread = threading.Thread(target=run_scoring_worker, args=(stop_event,), name=f"scoring-worker-{i}", daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+def get_scoring_job_counts():
+    conn = connect_jobs_database()
+    cur = conn.cursor()
+    cur.execute("SELECT state, COUNT(*) FROM scoring_jobs GROUP BY state")
+    counts = dict(cur.fetchall())
+    conn.close()
+    return counts
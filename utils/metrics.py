@@ -0,0 +1,98 @@
+# utils/metrics.py
+
+import bisect
+import logging
+import threading
+
+# Upper bounds of the histogram buckets, in seconds for timings
+DEFAULT_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf')]
+# For sub-millisecond steps, such as extracting one field of a parsed page
+FAST_BUCKETS = [0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, float('inf')]
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_gauges = {}
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS):
+    """
+    Records one observation in the named histogram.
+
+    Parameters:
+        name (str): The metric name, e.g. 'fetch.http'.
+        value (float): The observed value.
+        buckets (list of float): Bucket upper bounds, used when the histogram is created.
+    """
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = {
+                'buckets': list(buckets),
+                'counts': [0] * len(buckets),
+                'count': 0,
+                'sum': 0.0,
+                'max': 0.0,
+            }
+        histogram['counts'][bisect.bisect_left(histogram['buckets'], value)] += 1
+        histogram['count'] += 1
+        histogram['sum'] += value
+        histogram['max'] = max(histogram['max'], value)
+
+def increment(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def set_gauge(name, value):
+    with _lock:
+        _gauges[name] = value
+
+def get_histogram(name):
+    with _lock:
+        histogram = _histograms.get(name)
+        return None if histogram is None else {**histogram, 'counts': list(histogram['counts'])}
+
+def get_quantile(name, quantile):
+    """
+    Estimates a quantile of a histogram as the upper bound of the bucket it falls in.
+    """
+    histogram = get_histogram(name)
+    if not histogram or not histogram['count']:
+        return None
+    target = quantile * histogram['count']
+    seen = 0
+    for bound, count in zip(histogram['buckets'], histogram['counts']):
+        seen += count
+        if seen >= target:
+            return min(bound, histogram['max'])
+    return histogram['max']
+
+def get_metrics():
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'gauges': dict(_gauges),
+            'histograms': {
+                name: {
+                    'count': histogram['count'],
+                    'mean': histogram['sum'] / histogram['count'] if histogram['count'] else 0.0,
+                    'max': histogram['max'],
+                }
+                for name, histogram in _histograms.items()
+            },
+        }
+
+def log_metrics(prefix=''):
+    metrics = get_metrics()
+    for name, histogram in sorted(metrics['histograms'].items()):
+        if name.startswith(prefix):
+            logging.info(
+                f"{name}: count={histogram['count']} mean={histogram['mean']:.3f} "
+                f"p50={get_quantile(name, 0.5)} p95={get_quantile(name, 0.95)} max={histogram['max']:.3f}"
+            )
+    for name, value in sorted(metrics['counters'].items()):
+        if name.startswith(prefix):
+            logging.info(f"{name}: {value}")
+    for name, value in sorted(metrics['gauges'].items()):
+        if name.startswith(prefix):
+            logging.info(f"{name}: {value}")
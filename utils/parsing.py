@@ -0,0 +1,157 @@
+# utils/parsing.py
+
+import json
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from bs4 import BeautifulSoup
+
+import params
+from utils.metrics import observe, FAST_BUCKETS
+from utils.registry import resolve_extractor
+
+PARSER_CONFIG = params.get_parser_config()
+
+_available_backends = {}
+_parse_executor = None
+_parse_executor_lock = threading.Lock()
+
+
+def is_backend_available(backend):
+    if backend not in _available_backends:
+        if backend == 'lxml':
+            try:
+                import lxml  # noqa: F401
+                _available_backends[backend] = True
+            except ImportError:
+                logging.warning("lxml is not installed, falling back to html.parser")
+                _available_backends[backend] = False
+        else:
+            _available_backends[backend] = backend == 'html.parser'
+    return _available_backends[backend]
+
+def get_parser_backend(backend=None):
+    backend = backend or PARSER_CONFIG['backend']
+    return backend if is_backend_available(backend) else 'html.parser'
+
+def make_soup(html, parse_only=None, backend=None):
+    """
+    Parses HTML with the configured parser backend.
+
+    Parameters:
+        html (str): The document.
+        parse_only (bs4.SoupStrainer): Only build the tree for matching elements.
+        backend (str): Overrides the configured backend, e.g. for benchmarks.
+
+    Returns:
+        BeautifulSoup: The parsed document.
+    """
+    return BeautifulSoup(html, get_parser_backend(backend), parse_only=parse_only)
+
+def process_element(element, content_parts):
+    # If the element is a paragraph <p>, extract the text
+    if element.name == 'p':
+        text = element.get_text(strip=True)
+        if text:
+            content_parts.append(text)
+    # If the element is an unordered list <ul> or ordered list <ol>
+    elif element.name in ['ul', 'ol']:
+        is_ordered = element.name == 'ol'
+        list_items = element.find_all('li', recursive=False)
+        for idx, li in enumerate(list_items, 1):
+            li_text = li.get_text(strip=True)
+            if li_text:
+                if is_ordered:
+                    content_parts.append(f'{idx}. {li_text}')
+                else:
+                    content_parts.append(f'• {li_text}')
+    # If the element is a list item <li> outside of a list (edge case)
+    elif element.name == 'li':
+        li_text = element.get_text(strip=True)
+        if li_text:
+            content_parts.append(f'• {li_text}')
+    # If the element is a table
+    elif element.name == 'table':
+        # Convert the table to JSON
+        table_json = convert_table_to_json(element)
+        if table_json:
+            content_parts.append(table_json)
+    else:
+        # For other elements, process their children
+        for child in element.contents:
+            if isinstance(child, str):
+                continue  # Skip strings outside of desired tags
+            else:
+                process_element(child, content_parts)
+
+def convert_table_to_json(table_element):
+    # Extract table headers and rows
+    table_data = []
+    headers = []
+
+    # Find all rows in the table
+    rows = table_element.find_all('tr')
+    if not rows:
+        return None  # Return None if there are no rows
+
+    # Assume the first row might be headers
+    first_row = rows[0]
+    header_cells = first_row.find_all(['th', 'td'])
+    headers = [cell.get_text(strip=True) for cell in header_cells]
+
+    # Check if headers are meaningful (not all empty)
+    if any(headers):
+        data_rows = rows[1:]  # Exclude header row
+    else:
+        # No meaningful headers, treat all rows as data
+        headers = []
+        data_rows = rows
+
+    # Extract data from rows
+    for row in data_rows:
+        cells = row.find_all(['th', 'td'])
+        cell_data = [cell.get_text(strip=True) for cell in cells]
+        if headers and len(headers) == len(cell_data):
+            row_data = dict(zip(headers, cell_data))
+        else:
+            row_data = cell_data
+        table_data.append(row_data)
+
+    # Convert the table data to JSON
+    table_json = json.dumps(table_data)
+    return table_json
+
+def extract_content(article_element):
+    content_parts = []
+    process_element(article_element, content_parts)
+    # Join the content parts with newlines
+    return '\n'.join(content_parts)
+
+def record_extraction_timings(data):
+    # Records the timings an extractor returned with its data, in the scraper process
+    for name, seconds in (data or {}).pop('_timings', {}).items():
+        observe(name, seconds, buckets=FAST_BUCKETS)
+
+def extract_from_html(extractor_name, html):
+    # Runs in the parse worker processes, so the extractor is passed by name
+    return resolve_extractor(extractor_name).extract_article_data(make_soup(html))
+
+def get_parse_executor(workers):
+    """
+    Returns the shared process pool for parsing, created on first use. Workers are
+    spawned rather than forked because the scraper process runs threads.
+    """
+    global _parse_executor
+    with _parse_executor_lock:
+        if _parse_executor is None:
+            _parse_executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    return _parse_executor
+
+def shutdown_parse_executor():
+    global _parse_executor
+    with _parse_executor_lock:
+        if _parse_executor is not None:
+            _parse_executor.shutdown()
+            _parse_executor = None
@@ -0,0 +1,82 @@
+# utils/pipeline.py
+
+import logging
+import queue
+import threading
+import time
+
+from utils.metrics import observe, increment, set_gauge
+
+# Tells a stage worker that its input is exhausted
+STOP = object()
+
+
+def make_stage_queue(name, maxsize):
+    stage_queue = queue.Queue(maxsize=maxsize)
+    stage_queue.name = name
+    return stage_queue
+
+def run_stage_worker(stage, func):
+    name = stage['name']
+    in_queue = stage['queue']
+    while True:
+        item = in_queue.get()
+        set_gauge(f'pipeline.{in_queue.name}.queue_depth', in_queue.qsize())
+        if item is STOP:
+            break
+        started = time.perf_counter()
+        try:
+            func(item)
+            increment(f'pipeline.{name}.items')
+            with stage['lock']:
+                stage['items'] += 1
+        except Exception as e:
+            increment(f'pipeline.{name}.errors')
+            logging.error(f"Pipeline stage {name} failed: {e}")
+        observe(f'pipeline.{name}', time.perf_counter() - started)
+
+def start_stage(name, func, in_queue, workers):
+    """
+    Starts the worker threads of a pipeline stage. Each worker takes items from
+    in_queue and calls func(item); func passes its results on to the next stage's
+    queue itself, so a full downstream queue blocks the stage (backpressure).
+
+    Parameters:
+        name (str): The stage name used in metrics and logs.
+        func (callable): Processes one item.
+        in_queue (queue.Queue): The stage input, from make_stage_queue.
+        workers (int): Number of worker threads.
+
+    Returns:
+        dict: The stage, to pass to stop_stage.
+    """
+    stage = {
+        'name': name,
+        'queue': in_queue,
+        'threads': [],
+        'items': 0,
+        'lock': threading.Lock(),
+        'started': time.perf_counter(),
+        'elapsed': None,
+    }
+    for i in range(workers):
+        thread = threading.Thread(target=run_stage_worker, args=(stage, func), name=f"{name}-{i}", daemon=True)
+        thread.start()
+        stage['threads'].append(thread)
+    return stage
+
+def stop_stage(stage):
+    # Called once everything upstream has finished, so the stop markers come after the last item
+    for _ in stage['threads']:
+        stage['queue'].put(STOP)
+    for thread in stage['threads']:
+        thread.join()
+    stage['elapsed'] = time.perf_counter() - stage['started']
+
+def log_stage_throughput(stages):
+    for stage in stages:
+        elapsed = stage['elapsed'] or time.perf_counter() - stage['started']
+        logging.info(
+            f"Pipeline stage {stage['name']}: {stage['items']} items in {elapsed:.1f}s "
+            f"({stage['items'] / elapsed if elapsed else 0.0:.2f} items/s)"
+        )
@@ -0,0 +1,186 @@
+# utils/ratelimit.py
+
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import params
+
+RATE_LIMIT_CONFIG = params.get_rate_limit_config()
+SCORING_CONFIG = params.get_scoring_config()
+
+# Limiter state per model name. Only touched from the scoring event loop.
+_limiters = {}
+
+
+def get_limiter(model):
+    """
+    Returns the token bucket and adaptive concurrency state for a model,
+    creating it on first use.
+
+    Parameters:
+        model (dict): The model configuration dictionary.
+
+    Returns:
+        dict: The limiter state.
+    """
+    if model['name'] not in _limiters:
+        config = {
+            **RATE_LIMIT_CONFIG,
+            "max_concurrency": SCORING_CONFIG['max_concurrency_per_model'],
+            **model.get('rate_limit', {}),
+        }
+        _limiters[model['name']] = {
+            'config': config,
+            'tokens': float(config['burst']),
+            'last_refill': time.monotonic(),
+            'concurrency': float(config['initial_concurrency']),
+            'in_flight': 0,
+            'blocked_until': 0.0,
+            'last_decrease': 0.0,
+            'condition': asyncio.Condition(),
+            'requests': 0,
+            'rate_limited': 0,
+        }
+    return _limiters[model['name']]
+
+def is_rate_limit_error(error):
+    status = getattr(error, 'http_status', None) or getattr(error, 'status_code', None)
+    return status == 429 or type(error).__name__ == 'RateLimitError'
+
+def get_retry_after(error):
+    """
+    Reads the Retry-After header of a rate limit error, either as seconds or as an HTTP date.
+
+    Returns:
+        float or None: The number of seconds to wait, if the server sent one.
+    """
+    headers = getattr(error, 'headers', None) or getattr(getattr(error, 'response', None), 'headers', None) or {}
+    value = headers.get('retry-after') or headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def _refill(limiter):
+    now = time.monotonic()
+    config = limiter['config']
+    elapsed = now - limiter['last_refill']
+    limiter['tokens'] = min(float(config['burst']), limiter['tokens'] + elapsed * config['requests_per_second'])
+    limiter['last_refill'] = now
+
+async def acquire(model):
+    """
+    Waits for a free in-flight slot, the end of any Retry-After pause and a
+    token from the model's bucket.
+    """
+    limiter = get_limiter(model)
+    async with limiter['condition']:
+        await limiter['condition'].wait_for(lambda: limiter['in_flight'] < int(limiter['concurrency']))
+        limiter['in_flight'] += 1
+
+    # The caller only releases the slot once acquire returns, so give it back when
+    # the task is cancelled during the pause or the token wait
+    try:
+        while True:
+            now = time.monotonic()
+            if now < limiter['blocked_until']:
+                await asyncio.sleep(limiter['blocked_until'] - now)
+                continue
+            _refill(limiter)
+            if limiter['tokens'] >= 1:
+                limiter['tokens'] -= 1
+                return
+            await asyncio.sleep((1 - limiter['tokens']) / limiter['config']['requests_per_second'])
+    except BaseException:
+        await release(model)
+        raise
+
+async def release(model):
+    limiter = get_limiter(model)
+    async with limiter['condition']:
+        limiter['in_flight'] -= 1
+        limiter['condition'].notify_all()
+
+def on_success(model):
+    # Additive increase: about one extra slot per window of successful requests
+    limiter = get_limiter(model)
+    config = limiter['config']
+    limiter['requests'] += 1
+    limiter['concurrency'] = min(
+        float(config['max_concurrency']),
+        limiter['concurrency'] + config['increase_step'] / limiter['concurrency']
+    )
+
+def on_rate_limited(model, retry_after, attempt):
+    """
+    Multiplicative decrease of the in-flight limit and a pause of the whole model
+    until the Retry-After time. 429s that arrive while a pause is already in effect
+    belong to the same burst and do not shrink the limit again.
+
+    Returns:
+        float: The number of seconds the model is paused for.
+    """
+    limiter = get_limiter(model)
+    config = limiter['config']
+    now = time.monotonic()
+    limiter['requests'] += 1
+    limiter['rate_limited'] += 1
+
+    if retry_after is None:
+        retry_after = min(config['max_retry_delay'], config['base_retry_delay'] * 2 ** attempt)
+        retry_after *= random.uniform(0.5, 1.0)
+
+    if now >= limiter['last_decrease'] + 1.0 and now >= limiter['blocked_until']:
+        limiter['concurrency'] = max(float(config['min_concurrency']), limiter['concurrency'] * config['decrease_factor'])
+        limiter['last_decrease'] = now
+        logging.warning(f"Rate limited by {model['name']}, concurrency reduced to {int(limiter['concurrency'])}, pausing {retry_after:.1f}s")
+
+    limiter['blocked_until'] = max(limiter['blocked_until'], now + retry_after)
+    limiter['tokens'] = 0.0
+    return retry_after
+
+async def call_with_rate_limit(model, request):
+    """
+    Runs a request coroutine factory under the model's rate limiter and retries it
+    on 429 responses. Other errors are raised immediately.
+
+    Parameters:
+        model (dict): The model configuration dictionary.
+        request (callable): A function returning a new request coroutine on each call.
+
+    Returns:
+        The request result.
+    """
+    max_retries = get_limiter(model)['config']['max_retries']
+    for attempt in range(max_retries + 1):
+        await acquire(model)
+        try:
+            result = await request()
+            on_success(model)
+            return result
+        except Exception as e:
+            if not is_rate_limit_error(e) or attempt == max_retries:
+                raise
+            on_rate_limited(model, get_retry_after(e), attempt)
+        finally:
+            await release(model)
+
+def get_rate_limit_stats():
+    return {
+        model_name: {
+            'concurrency': int(limiter['concurrency']),
+            'in_flight': limiter['in_flight'],
+            'requests': limiter['requests'],
+            'rate_limited': limiter['rate_limited'],
+        }
+        for model_name, limiter in _limiters.items()
+    }
@@ -0,0 +1,88 @@
+# utils/registry.py
+
+import logging
+import pkgutil
+from importlib import import_module
+from urllib.parse import urlparse
+
+import params
+
+SOURCE_CONFIG = params.get_source_config()
+
+# Discovered extractor modules per kind ('links' or 'articles'), by module name
+_extractors = {}
+
+
+def discover_extractors(kind):
+    """
+    Imports every module under extractors/<kind>.
+
+    Returns:
+        dict: Mapping of module name to module.
+    """
+    if kind not in _extractors:
+        package = import_module(f"extractors.{kind}")
+        modules = {}
+        for module_info in pkgutil.iter_modules(package.__path__):
+            try:
+                modules[module_info.name] = import_module(f"extractors.{kind}.{module_info.name}")
+            except Exception as e:
+                logging.error(f"Failed to load extractor extractors.{kind}.{module_info.name}: {e}")
+        _extractors[kind] = modules
+    return _extractors[kind]
+
+def matches_domain(host, domains):
+    return any(host == domain or host.endswith('.' + domain) for domain in domains)
+
+def get_article_extractor(url):
+    """
+    Returns the article extractor whose DOMAINS cover the host of a url. Hand-written
+    extractor modules take precedence over the ones modules build from configuration
+    through get_extractors(), such as the template extractors.
+
+    Returns:
+        module or None: The extractor, or None if no extractor handles the domain.
+    """
+    host = urlparse(url).netloc
+    modules = discover_extractors('articles').values()
+    for module in modules:
+        if matches_domain(host, getattr(module, 'DOMAINS', [])):
+            return module
+    for module in modules:
+        for extractor in getattr(module, 'get_extractors', list)():
+            if matches_domain(host, extractor.DOMAINS):
+                return extractor
+    return None
+
+def resolve_extractor(name):
+    """
+    Returns an extractor by its __name__: a module path, or 'module:name' for an
+    extractor built by that module's get_extractor(name). Extractors are passed by
+    name to the parse worker processes.
+    """
+    module_name, _, extractor_name = name.partition(':')
+    module = import_module(module_name)
+    return module.get_extractor(extractor_name) if extractor_name else module
+
+def get_sources():
+    """
+    Builds one source per link extractor module: the topic pages it polls (SOURCE_URLS),
+    the domains of its articles (DOMAINS), and its cadence and concurrency from
+    params.get_source_config().
+
+    Returns:
+        list of dict: The enabled sources.
+    """
+    sources = []
+    for name, module in discover_extractors('links').items():
+        config = {**SOURCE_CONFIG['default'], **SOURCE_CONFIG.get(name, {})}
+        if not config['enabled']:
+            continue
+        sources.append({
+            'name': name,
+            'link_extractor': module,
+            'urls': list(getattr(module, 'SOURCE_URLS', [])),
+            'domains': list(getattr(module, 'DOMAINS', [])),
+            **config,
+        })
+    return sources
@@ -0,0 +1,167 @@
+# utils/scheduler.py
+
+import logging
+import threading
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import params
+from utils.metrics import observe, increment, set_gauge
+
+SCHEDULER_CONFIG = params.get_scheduler_config()
+LINK_POLL_CONFIG = SCHEDULER_CONFIG['link_poll']
+
+# Scheduled tasks by name
+_tasks = {}
+_wake = threading.Event()
+
+
+def add_task(name, func, interval, initial_delay=0):
+    """
+    Registers a task with its own cadence.
+
+    Parameters:
+        name (str): The task name, used in logs, metrics and trigger_task.
+        func (callable): Runs the task.
+        interval (float or callable): Seconds between starts, or a function returning them,
+            evaluated each time the task is scheduled.
+        initial_delay (float): Seconds before the first run.
+    """
+    _tasks[name] = {
+        'name': name,
+        'func': func,
+        'interval': interval,
+        'next_run': time.monotonic() + initial_delay,
+        'running': False,
+        'runs': 0,
+        'last_duration': None,
+    }
+
+def trigger_task(name):
+    # Runs a task as soon as it is not running, e.g. the backlog drain after new links arrive
+    task = _tasks.get(name)
+    if task:
+        task['next_run'] = min(task['next_run'], time.monotonic())
+        _wake.set()
+
+def get_interval(task):
+    interval = task['interval']
+    return interval() if callable(interval) else interval
+
+def run_task(task):
+    started = time.perf_counter()
+    try:
+        task['func']()
+    except Exception as e:
+        increment(f"scheduler.{task['name']}.errors")
+        logging.error(f"Scheduled task {task['name']} failed: {e}")
+    finally:
+        task['last_duration'] = time.perf_counter() - started
+        task['runs'] += 1
+        observe(f"scheduler.{task['name']}", task['last_duration'])
+        task['running'] = False
+        _wake.set()
+
+def start_task(task, now):
+    """
+    Starts a due task in its own thread and schedules its next start from the
+    scheduled time, not the finish time, so the cadence does not drift. Starts that
+    were missed while the task was still running are skipped rather than queued.
+    """
+    interval = get_interval(task)
+    set_gauge(f"scheduler.{task['name']}.interval", interval)
+    next_run = task['next_run'] + interval
+    if next_run <= now:
+        missed = int((now - next_run) // interval) + 1
+        increment(f"scheduler.{task['name']}.skipped", missed)
+        next_run += missed * interval
+    task['next_run'] = next_run
+    task['running'] = True
+    threading.Thread(target=run_task, args=(task,), name=f"task-{task['name']}", daemon=True).start()
+
+def run_scheduler(stop_event):
+    """
+    Runs the registered tasks until stop_event is set. A task never overlaps with
+    itself; different tasks run concurrently.
+    """
+    while not stop_event.is_set():
+        now = time.monotonic()
+        for task in _tasks.values():
+            if not task['running'] and task['next_run'] <= now:
+                start_task(task, now)
+        waiting = [task['next_run'] for task in _tasks.values() if not task['running']]
+        delay = min(waiting) - time.monotonic() if waiting else 1.0
+        _wake.wait(max(0.0, min(delay, 1.0)))
+        _wake.clear()
+
+def wait_for_tasks(timeout):
+    deadline = time.monotonic() + timeout
+    while any(task['running'] for task in _tasks.values()) and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+def get_scheduler_stats():
+    now = time.monotonic()
+    return {
+        name: {
+            'running': task['running'],
+            'runs': task['runs'],
+            'last_duration': round(task['last_duration'], 1) if task['last_duration'] is not None else None,
+            'next_in': round(max(0.0, task['next_run'] - now), 1),
+        }
+        for name, task in _tasks.items()
+    }
+
+def parse_clock(value):
+    hours, minutes = value.split(':')
+    return int(hours) * 60 + int(minutes)
+
+def get_market_session(now=None):
+    """
+    Returns:
+        str: 'market' during US market hours, 'extended' on weekdays around them,
+        'overnight' otherwise.
+    """
+    now = now or datetime.now(ZoneInfo(SCHEDULER_CONFIG['market_timezone']))
+    minutes = now.hour * 60 + now.minute
+    if now.weekday() >= 5:
+        return 'overnight'
+    if parse_clock(SCHEDULER_CONFIG['market_open']) <= minutes < parse_clock(SCHEDULER_CONFIG['market_close']):
+        return 'market'
+    if parse_clock(SCHEDULER_CONFIG['extended_open']) <= minutes < parse_clock(SCHEDULER_CONFIG['extended_close']):
+        return 'extended'
+    return 'overnight'
+
+def get_link_poll_interval(history, now=None):
+    """
+    Chooses the next link polling interval from the market session and the observed
+    link arrival rate.
+
+    Parameters:
+        history (list of tuple): (poll unix time, number of new links) of recent polls.
+        now (datetime): The current time, for tests.
+
+    Returns:
+        float: Seconds until the next poll.
+    """
+    session_interval = LINK_POLL_CONFIG[f'{get_market_session(now)}_interval']
+
+    # Bursty news: poll quickly while polls keep finding several new links
+    if history and history[-1][1] >= LINK_POLL_CONFIG['burst_links']:
+        return LINK_POLL_CONFIG['burst_interval']
+
+    interval = session_interval
+    window_start = time.time() - LINK_POLL_CONFIG['rate_window']
+    recent = [(poll_unix, new_links) for poll_unix, new_links in history if poll_unix >= window_start]
+    if len(recent) >= 2:
+        elapsed = recent[-1][0] - recent[0][0]
+        arrivals = sum(new_links for _, new_links in recent[1:])
+        if elapsed > 0 and arrivals:
+            # Expect about target_links_per_poll new links per poll, but never poll
+            # slower than the session interval while links are arriving
+            interval = min(session_interval, LINK_POLL_CONFIG['target_links_per_poll'] * elapsed / arrivals)
+        elif elapsed >= LINK_POLL_CONFIG['rate_window'] / 2:
+            # Quiet for a while: back off beyond the session interval
+            interval = session_interval * 2
+
+    return max(LINK_POLL_CONFIG['min_interval'], min(LINK_POLL_CONFIG['max_interval'], interval))
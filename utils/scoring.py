@@ -0,0 +1,552 @@
+# utils/scoring.py
+
+import asyncio
+import json
+import logging
+import math
+import re
+import threading
+from importlib import import_module
+
+from together import AsyncTogether
+from keys.together import together_api_key
+import params
+from utils.cache import make_cache_key, get_cached_score_async, store_cached_score_async
+from utils.ratelimit import call_with_rate_limit
+
+NEWS_PROMPTS = params.get_news_prompts()
+TWITTER_PROMPTS = params.get_twitter_prompts()
+SCORING_CONFIG = params.get_scoring_config()
+CASCADE_CONFIG = params.get_cascade_config()
+
+_loop = None
+_loop_lock = threading.Lock()
+_client = None
+_global_semaphore = None
+
+# Scoring backends other than the Together API, keyed by the model's "backend" value.
+# A backend module registers itself when imported, on first use of the backend.
+SCORING_BACKENDS = {}
+BACKEND_MODULES = {'local': 'utils.distill'}
+
+
+def register_backend(name, score_fn):
+    """
+    Registers a scoring backend for models configured with {"backend": name}.
+    score_fn is a coroutine function with the signature of score_message.
+    """
+    SCORING_BACKENDS[name] = score_fn
+
+def get_backend(name):
+    if name not in SCORING_BACKENDS and name in BACKEND_MODULES:
+        import_module(BACKEND_MODULES[name])
+    return SCORING_BACKENDS.get(name)
+
+def get_event_loop():
+    """
+    Returns the long-lived event loop that runs all scoring requests.
+    The loop is started lazily in a daemon thread so that the client, the
+    semaphore and the rate limiters are created once and shared by every caller.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_loop.run_forever, name="scoring-loop", daemon=True)
+            thread.start()
+    return _loop
+
+def run_coroutine(coro):
+    """
+    Runs a coroutine on the scoring loop from synchronous code and waits for its result.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+def get_client():
+    global _client
+    if _client is None:
+        # Retries are handled by the per-model rate limiter
+        _client = AsyncTogether(api_key=together_api_key(), max_retries=0)
+    return _client
+
+def get_global_semaphore():
+    global _global_semaphore
+    if _global_semaphore is None:
+        _global_semaphore = asyncio.Semaphore(SCORING_CONFIG['max_concurrency'])
+    return _global_semaphore
+
+def build_article_message(title, content):
+    return f"Title: {title}\n\nContent: {content}"
+
+def build_tweet_message(text):
+    return f"Tweet: {text}"
+
+def get_prompts(is_twitter):
+    return TWITTER_PROMPTS if is_twitter else NEWS_PROMPTS
+
+def build_system_prompt(crypto_name, is_twitter=False):
+    content_type = "tweet" if is_twitter else "news article"
+    return f"""
+    You are an expert in analyzing {content_type}s about cryptocurrency and {crypto_name}.
+    You will be given a {content_type} about {crypto_name} and asked to rate a specific aspect.
+    Provide a single integer score from 1 to 10 based on the content for the given aspect.
+    Only respond with the score, nothing else. Do not include any explanations.
+    Remember, only output a single integer from 1 to 10, nothing else.
+    """
+
+def build_aspect_prompt(base_system_prompt, prompt):
+    return base_system_prompt + f"\n\nAspect to rate:\n{prompt['prompt']}"
+
+def build_multi_aspect_system_prompt(crypto_name, prompts, is_twitter=False):
+    content_type = "tweet" if is_twitter else "news article"
+    aspects = "\n\n".join(f"{prompt['aspect']}:\n{prompt['prompt']}" for prompt in prompts)
+    keys = ", ".join(f'"{prompt["aspect"]}"' for prompt in prompts)
+    return f"""
+    You are an expert in analyzing {content_type}s about cryptocurrency and {crypto_name}.
+    You will be given a {content_type} about {crypto_name} and asked to rate several aspects.
+    For each aspect, provide a single integer score from 1 to 10 based on the content.
+    Respond with a JSON object only, using exactly these keys: {keys}.
+    Each value must be a single integer from 1 to 10. Do not include any explanations.
+
+    Aspects to rate:
+
+    {aspects}
+    """
+
+def build_multi_crypto_system_prompt(crypto_names, prompts, is_twitter=False):
+    content_type = "tweet" if is_twitter else "news article"
+    cryptos = ", ".join(crypto_names)
+    aspects = "\n\n".join(f"{prompt['aspect']}:\n{prompt['prompt']}" for prompt in prompts)
+    keys = ", ".join(f'"{prompt["aspect"]}"' for prompt in prompts)
+    return f"""
+    You are an expert in analyzing {content_type}s about cryptocurrency.
+    You will be given a {content_type} that mentions several cryptocurrencies: {cryptos}.
+    Rate several aspects of the {content_type} separately for each of these cryptocurrencies.
+    For each cryptocurrency and aspect, provide a single integer score from 1 to 10 based on the content.
+    Respond with a JSON object only, with one key per cryptocurrency ({cryptos}).
+    Each value must be an object using exactly these keys: {keys}, each a single integer from 1 to 10.
+    Do not include any explanations.
+
+    Aspects to rate:
+
+    {aspects}
+    """
+
+def build_aspect_schema(prompts):
+    return {
+        "type": "object",
+        "properties": {
+            prompt['aspect']: {"type": "integer", "minimum": 1, "maximum": 10}
+            for prompt in prompts
+        },
+        "required": [prompt['aspect'] for prompt in prompts],
+    }
+
+def normalize_aspect(aspect):
+    return aspect.strip().lower().replace(' ', '_')
+
+def parse_score_value(score):
+    try:
+        score_int = int(str(score).strip())
+    except ValueError:
+        return None
+    return score_int if 1 <= score_int <= 10 else None
+
+def parse_score(aspect, score):
+    score_int = parse_score_value(score)
+    if score_int is None:
+        logging.warning(f"Invalid or out of range response for {aspect}: {score}")
+        return 5  # Default to neutral if parsing fails or out of range
+    return score_int
+
+def extract_json_object(content):
+    match = re.search(r"\{.*\}", content, re.DOTALL)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+def validate_aspect_scores(data, prompts):
+    values = {normalize_aspect(key): value for key, value in data.items()}
+    scores = {}
+    for prompt in prompts:
+        score = parse_score_value(values.get(normalize_aspect(prompt['aspect']), ''))
+        if score is not None:
+            scores[prompt['aspect']] = score
+    return scores
+
+def parse_aspect_scores(content, prompts):
+    """
+    Parses a multi-aspect JSON reply and validates it against the aspect list.
+
+    Returns:
+        dict: Mapping of aspect name to integer score, only for aspects with a valid score.
+    """
+    data = extract_json_object(content)
+    if data is None:
+        return {}
+    return validate_aspect_scores(data, prompts)
+
+def parse_crypto_aspect_scores(content, crypto_names, prompts):
+    """
+    Parses a multi-crypto JSON reply keyed by crypto and then by aspect.
+
+    Returns:
+        dict: Mapping of crypto name to its valid aspect scores.
+    """
+    data = extract_json_object(content)
+    if data is None:
+        return {crypto_name: {} for crypto_name in crypto_names}
+    values = {key.strip().lower(): value for key, value in data.items()}
+    return {
+        crypto_name: validate_aspect_scores(values[crypto_name.lower()], prompts)
+        if isinstance(values.get(crypto_name.lower()), dict) else {}
+        for crypto_name in crypto_names
+    }
+
+async def create_completion(model, messages, **overrides):
+    """
+    Sends one chat completion through the shared client. Requests are paced and
+    retried on 429s by the model's adaptive rate limiter and bounded by the global
+    concurrency limit.
+    """
+    request_params = {**model['params'], **overrides}
+
+    async def request():
+        async with get_global_semaphore():
+            return await asyncio.wait_for(
+                get_client().chat.completions.create(
+                    model=model['name'],
+                    messages=messages,
+                    **request_params
+                ),
+                timeout=SCORING_CONFIG['request_timeout']
+            )
+
+    return await call_with_rate_limit(model, request)
+
+async def score_aspect(model, system_prompt, message, aspect, fallback=True):
+    cache_key = make_cache_key(model, system_prompt, message)
+    cached = await get_cached_score_async(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        response = await create_completion(model, [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": message},
+        ])
+        score = response.choices[0].message.content.strip()
+        logging.debug(f"Model: {model['name']}, Aspect: {aspect}, Score: {score}")
+        if parse_score_value(score) is not None:
+            await store_cached_score_async(cache_key, model['name'], parse_score_value(score))
+        return parse_score(aspect, score)
+    except Exception as e:
+        if not fallback:
+            raise
+        logging.error(f"Error processing model response for {aspect}: {e}")
+        return 5  # Default to neutral if processing fails
+
+def extract_top_logprobs(response):
+    """
+    Returns the candidate tokens and log probabilities of the first generated token.
+    Handles both the Together format (a token -> logprob dict per position) and the
+    OpenAI format (a list of {token, logprob} entries per position).
+    """
+    logprobs = response.choices[0].logprobs
+    if logprobs is None:
+        return {}
+
+    content = getattr(logprobs, 'content', None)
+    if content:
+        return {entry.token: entry.logprob for entry in content[0].top_logprobs}
+
+    top_logprobs = getattr(logprobs, 'top_logprobs', None)
+    if top_logprobs:
+        return dict(top_logprobs[0])
+
+    tokens = getattr(logprobs, 'tokens', None) or []
+    token_logprobs = getattr(logprobs, 'token_logprobs', None) or []
+    return dict(zip(tokens[:1], token_logprobs[:1]))
+
+def expected_score_from_logprobs(top_logprobs):
+    """
+    Turns the candidate tokens for a single-token reply into a score distribution.
+    Only the tokens "1".."10" are kept and their probabilities renormalized, so this
+    is only valid for models that emit "10" as one token (see score_aspect_logprobs).
+
+    Returns:
+        tuple: (argmax score, expected score, confidence) or None if no score token was found.
+    """
+    probabilities = {}
+    for token, logprob in top_logprobs.items():
+        score = parse_score_value(token)
+        if score is not None:
+            probabilities[score] = probabilities.get(score, 0.0) + math.exp(logprob)
+
+    total = sum(probabilities.values())
+    if total <= 0:
+        return None
+
+    best_score = max(probabilities, key=probabilities.get)
+    expected = sum(score * probability for score, probability in probabilities.items()) / total
+    confidence = probabilities[best_score] / total
+    return best_score, expected, confidence
+
+async def score_aspect_logprobs(model, system_prompt, message, aspect, fallback=True):
+    """
+    Scores one aspect by generating a single token and reading the top logprobs.
+
+    Models configured with "splits_digits" tokenize "10" as "1" + "0", so a single token
+    cannot tell 1 from 10. They are scored with a plain completion instead, with an
+    unknown confidence.
+
+    Returns:
+        dict: The argmax score under the aspect name, plus '<aspect>_expected' and
+        '<aspect>_confidence' entries.
+    """
+    if model.get('splits_digits'):
+        score = await score_aspect(model, system_prompt, message, aspect, fallback)
+        return {aspect: score, f"{aspect}_expected": float(score), f"{aspect}_confidence": None}
+
+    overrides = {"max_tokens": 1, "logprobs": SCORING_CONFIG['top_logprobs']}
+    cache_key = make_cache_key(model, system_prompt, message, overrides)
+    cached = await get_cached_score_async(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        response = await create_completion(model, [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": message},
+        ], **overrides)
+        distribution = expected_score_from_logprobs(extract_top_logprobs(response))
+        if distribution is None:
+            score = parse_score(aspect, response.choices[0].message.content.strip())
+            return {aspect: score, f"{aspect}_expected": float(score), f"{aspect}_confidence": 0.0}
+
+        score, expected, confidence = distribution
+        logging.debug(f"Model: {model['name']}, Aspect: {aspect}, Score: {score}, Expected: {expected:.2f}, Confidence: {confidence:.2f}")
+        result = {aspect: score, f"{aspect}_expected": expected, f"{aspect}_confidence": confidence}
+        await store_cached_score_async(cache_key, model['name'], result)
+        return result
+    except Exception as e:
+        if not fallback:
+            raise
+        logging.error(f"Error processing model logprobs for {aspect}: {e}")
+        return {aspect: 5, f"{aspect}_expected": 5.0, f"{aspect}_confidence": 0.0}
+
+async def score_aspects(message, model, crypto_name, prompts, is_twitter=False, fallback=True):
+    base_system_prompt = build_system_prompt(crypto_name, is_twitter)
+    if SCORING_CONFIG['mode'] == 'logprob':
+        results = await asyncio.gather(*[
+            score_aspect_logprobs(model, build_aspect_prompt(base_system_prompt, prompt), message, prompt['aspect'], fallback)
+            for prompt in prompts
+        ])
+        return {key: value for result in results for key, value in result.items()}
+
+    scores = await asyncio.gather(*[
+        score_aspect(model, build_aspect_prompt(base_system_prompt, prompt), message, prompt['aspect'], fallback)
+        for prompt in prompts
+    ])
+    return {prompt['aspect']: score for prompt, score in zip(prompts, scores)}
+
+def select_aspect_scores(scores, prompts):
+    # Aspect scores in prompt order, keeping the logprob values of aspects that fell
+    # back to per-aspect scoring
+    selected = {}
+    for prompt in prompts:
+        aspect = prompt['aspect']
+        selected[aspect] = scores[aspect]
+        for key in (f"{aspect}_expected", f"{aspect}_confidence"):
+            if key in scores:
+                selected[key] = scores[key]
+    return selected
+
+async def score_multi_aspect(message, model, crypto_name, prompts, is_twitter=False, fallback=True):
+    """
+    Scores all aspects with a single request that returns a JSON object.
+    Aspects missing from the reply, or with an invalid score, fall back to one
+    request per aspect.
+    """
+    overrides = {}
+    if SCORING_CONFIG['json_response_format']:
+        overrides['response_format'] = {"type": "json_object", "schema": build_aspect_schema(prompts)}
+
+    system_prompt = build_multi_aspect_system_prompt(crypto_name, prompts, is_twitter)
+    cache_key = make_cache_key(model, system_prompt, message, overrides)
+    scores = await get_cached_score_async(cache_key) or {}
+    if not scores:
+        try:
+            response = await create_completion(model, [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": message},
+            ], **overrides)
+            content = response.choices[0].message.content
+            logging.debug(f"Model: {model['name']}, Scores: {content}")
+            scores = parse_aspect_scores(content, prompts)
+            if scores:
+                await store_cached_score_async(cache_key, model['name'], scores)
+        except Exception as e:
+            logging.error(f"Error processing multi-aspect response from {model['name']}: {e}")
+
+    missing = [prompt for prompt in prompts if prompt['aspect'] not in scores]
+    if missing:
+        logging.warning(f"Falling back to per-aspect scoring for {model['name']}: {[prompt['aspect'] for prompt in missing]}")
+        scores.update(await score_aspects(message, model, crypto_name, missing, is_twitter, fallback))
+
+    return select_aspect_scores(scores, prompts)
+
+async def score_message(message, model, crypto_name, is_twitter=False, fallback=True):
+    """
+    Scores every aspect of one message with one model, either with one request
+    per aspect (run concurrently) or with a single multi-aspect request.
+    With fallback=False, request errors are raised instead of scored as neutral 5s.
+
+    Returns:
+        dict: Mapping of aspect name to integer score. In logprob mode the dict also
+        holds '<aspect>_expected' and '<aspect>_confidence' values.
+    """
+    backend = get_backend(model.get('backend'))
+    if backend is not None:
+        return await backend(message, model, crypto_name, is_twitter, fallback)
+
+    prompts = get_prompts(is_twitter)
+    if SCORING_CONFIG['mode'] == 'multi_aspect':
+        return await score_multi_aspect(message, model, crypto_name, prompts, is_twitter, fallback)
+    return await score_aspects(message, model, crypto_name, prompts, is_twitter, fallback)
+
+async def score_message_multi_crypto(message, model, crypto_names, is_twitter=False, fallback=True):
+    """
+    Scores all aspects for several cryptos with a single request per model. Aspects
+    missing from the reply fall back to one request per aspect for that crypto.
+
+    Returns:
+        dict: Mapping of crypto name to its aspect scores.
+    """
+    prompts = get_prompts(is_twitter)
+    overrides = {}
+    if SCORING_CONFIG['json_response_format']:
+        overrides['response_format'] = {"type": "json_object", "schema": {
+            "type": "object",
+            "properties": {crypto_name: build_aspect_schema(prompts) for crypto_name in crypto_names},
+            "required": list(crypto_names),
+        }}
+
+    system_prompt = build_multi_crypto_system_prompt(crypto_names, prompts, is_twitter)
+    cache_key = make_cache_key(model, system_prompt, message, overrides)
+    scores = await get_cached_score_async(cache_key)
+    if not scores:
+        scores = {crypto_name: {} for crypto_name in crypto_names}
+        try:
+            response = await create_completion(model, [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": message},
+            ], **overrides)
+            content = response.choices[0].message.content
+            logging.debug(f"Model: {model['name']}, Scores: {content}")
+            scores = parse_crypto_aspect_scores(content, crypto_names, prompts)
+            if any(scores.values()):
+                await store_cached_score_async(cache_key, model['name'], scores)
+        except Exception as e:
+            logging.error(f"Error processing multi-crypto response from {model['name']}: {e}")
+
+    async def complete(crypto_name):
+        crypto_scores = dict(scores.get(crypto_name, {}))
+        missing = [prompt for prompt in prompts if prompt['aspect'] not in crypto_scores]
+        if missing:
+            logging.warning(f"Falling back to per-aspect scoring of {crypto_name} for {model['name']}: {[prompt['aspect'] for prompt in missing]}")
+            crypto_scores.update(await score_aspects(message, model, crypto_name, missing, is_twitter, fallback))
+        return select_aspect_scores(crypto_scores, prompts)
+
+    results = await asyncio.gather(*[complete(crypto_name) for crypto_name in crypto_names])
+    return dict(zip(crypto_names, results))
+
+def get_cascade_models(models):
+    models_by_name = {model['name']: model for model in models}
+    return [models_by_name[name] for name in CASCADE_CONFIG['models'] if name in models_by_name]
+
+def get_cascade_settings(aspect):
+    return {**CASCADE_CONFIG['default'], **CASCADE_CONFIG['aspects'].get(aspect, {})}
+
+async def score_single_aspect(model, base_system_prompt, message, prompt, fallback=True):
+    """
+    Scores one aspect with one model using the per-aspect request of the current mode.
+
+    Returns:
+        dict: The aspect score, plus expected score and confidence in logprob mode.
+    """
+    system_prompt = build_aspect_prompt(base_system_prompt, prompt)
+    if SCORING_CONFIG['mode'] == 'logprob':
+        return await score_aspect_logprobs(model, system_prompt, message, prompt['aspect'], fallback)
+    return {prompt['aspect']: await score_aspect(model, system_prompt, message, prompt['aspect'], fallback)}
+
+def get_ambiguity(result, aspect, settings):
+    low, high = settings['mid_range']
+    if low <= result[aspect] <= high:
+        return 'mid_range'
+    confidence = result.get(f"{aspect}_confidence")
+    if confidence is not None and confidence < settings['min_confidence']:
+        return 'low_confidence'
+    return None
+
+async def cascade_aspect(models, base_system_prompt, message, prompt, fallback=True):
+    """
+    Scores one aspect with the cheapest model first and escalates to the larger
+    models only when the score is ambiguous: mid-range, low logprob confidence,
+    or in disagreement with the second model's quick second opinion.
+
+    Returns:
+        tuple: (mapping of model name to its result, decision dict with the models used and the reason).
+    """
+    aspect = prompt['aspect']
+    settings = get_cascade_settings(aspect)
+    models = models[:settings['depth']]
+
+    results = {models[0]['name']: await score_single_aspect(models[0], base_system_prompt, message, prompt, fallback)}
+    reason = get_ambiguity(results[models[0]['name']], aspect, settings)
+
+    escalate_from = 1
+    if reason is None and settings['second_opinion'] and len(models) > 1:
+        results[models[1]['name']] = await score_single_aspect(models[1], base_system_prompt, message, prompt, fallback)
+        escalate_from = 2
+        if abs(results[models[0]['name']][aspect] - results[models[1]['name']][aspect]) > settings['max_disagreement']:
+            reason = 'disagreement'
+
+    if reason is not None:
+        escalated = await asyncio.gather(*[
+            score_single_aspect(model, base_system_prompt, message, prompt, fallback)
+            for model in models[escalate_from:]
+        ])
+        for model, result in zip(models[escalate_from:], escalated):
+            results[model['name']] = result
+
+    return results, {'models': list(results), 'reason': reason or 'clear'}
+
+async def score_message_cascade(message, models, crypto_name, is_twitter=False, fallback=True):
+    """
+    Scores every aspect of one message through the model cascade. The cascade always
+    uses per-aspect requests, also when the scoring mode is multi_aspect.
+
+    Returns:
+        tuple: (mapping of model name to the aspect scores it produced,
+        mapping of aspect name to the cascade decision).
+    """
+    prompts = get_prompts(is_twitter)
+    cascade_models = get_cascade_models(models)
+    base_system_prompt = build_system_prompt(crypto_name, is_twitter)
+    outcomes = await asyncio.gather(*[
+        cascade_aspect(cascade_models, base_system_prompt, message, prompt, fallback)
+        for prompt in prompts
+    ])
+
+    scores = {}
+    decisions = {}
+    for prompt, (results, decision) in zip(prompts, outcomes):
+        for model_name, result in results.items():
+            scores.setdefault(model_name, {}).update(result)
+        decisions[prompt['aspect']] = decision
+    return scores, decisions
@@ -1,51 +1,138 @@
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-
-from bs4 import BeautifulSoup
-import logging
-
-from utils.database import update_new_links, store_article, get_unscraped_links
-
-from bs4 import BeautifulSoup
 import logging
+import hashlib
 import sqlite3
+import time
 
-from utils.database import update_new_links, store_article, get_unscraped_links
-from utils.browser import initialize_browser, handle_cookie_consent
+from utils.database import update_new_links, store_article, get_unscraped_links, copy_news_scores, copy_cascade_decisions, schedule_link_retry
+from utils.dedup import get_duplicate_of
+from utils.browser import load_page, checkout_browser, return_browser, get_browser_pool_size
+from utils.fetch import fetch_html, fetch_html_if_modified, get_host, is_host_paused, get_host_backoff, on_host_rate_limited
+from utils.parsing import make_soup, extract_from_html, get_parse_executor, record_extraction_timings
+from utils.pipeline import make_stage_queue, start_stage, stop_stage, log_stage_throughput
+from utils.registry import get_article_extractor, matches_domain
+from utils.archive import archive_page
+from utils.metrics import observe, increment, log_metrics
 import params
 
 URL = params.get_news_url()
-EXTRACTORS = params.get_extractors()
 CRYPTO_KEYWORDS = params.get_crypto_keywords()
 DB_NAME = params.get_db_name()
 MODELS = params.get_models()
+DEDUP_CONFIG = params.get_dedup_config()
+CASCADE_CONFIG = params.get_cascade_config()
+PIPELINE_CONFIG = params.get_pipeline_config()
+
+# Per topic page: HTTP validators, hashes of the last HTML and link set, and recent new-link counts
+LINK_POLL_STATE = {}
+LINK_POLL_HISTORY = 120
+NEW_LINKS_BUCKETS = [0, 1, 2, 5, 10, 20, 50, float('inf')]
+
+from utils.jobs import enqueue_scoring_jobs
+from utils.distill import store_provisional_news_scores
+
+def with_browser(fetch, *args):
+    # Runs fetch(driver, *args) on a driver checked out of the browser pool
+    entry = checkout_browser()
+    started = time.perf_counter()
+    try:
+        result = fetch(entry['driver'], *args)
+    except Exception:
+        return_browser(entry, success=False)
+        raise
+    finally:
+        observe('fetch.browser', time.perf_counter() - started)
+    return_browser(entry)
+    return result
 
-from utils.sentimemt import get_model_responses
+def get_links_hash(links):
+    return hashlib.sha256('\n'.join(sorted(set(links))).encode('utf-8')).hexdigest()
 
-def scrape_and_store_links(driver, url, link_extractor):
+def record_link_poll(state, new_count):
+    observe('links.new_per_poll', new_count, buckets=NEW_LINKS_BUCKETS)
+    state['history'].append((int(time.time()), new_count))
+    del state['history'][:-LINK_POLL_HISTORY]
+
+def get_link_poll_history(url=URL):
+    """
+    Returns:
+        list of tuple: (poll unix time, number of new links) for the recent polls of a topic page.
+    """
+    return list(LINK_POLL_STATE.get(url, {}).get('history', []))
+
+def scrape_and_store_links(url, link_extractor):
+    """
+    Polls a topic page and stores the links that were not seen before. Parsing is
+    skipped when the server reports the page unchanged (ETag/Last-Modified) or the
+    HTML is byte-identical to the last poll, and the database is not touched when the
+    extracted link set did not change.
+
+    Returns:
+        list: The newly stored links.
+    """
+    state = LINK_POLL_STATE.setdefault(url, {'validators': {}, 'html_hash': None, 'links_hash': None, 'history': []})
     new_links = []
+    if is_host_paused(url):
+        increment('links.poll.host_paused')
+        return new_links
     try:
-        found_links = link_extractor.extract_links(driver, url)
+        found_links = []
+        html, state['validators'], not_modified = fetch_html_if_modified(url, state['validators'])
+        if not html and not not_modified and get_host_backoff(url) > 0:
+            # Throttled; the browser would be throttled as well
+            increment('links.poll.host_paused')
+            return new_links
+        if not_modified:
+            increment('links.poll.not_modified')
+            record_link_poll(state, 0)
+            return new_links
+        if html:
+            html_hash = hashlib.sha256(html.encode('utf-8')).hexdigest()
+            if html_hash == state['html_hash']:
+                increment('links.poll.unchanged')
+                record_link_poll(state, 0)
+                return new_links
+            state['html_hash'] = html_hash
+            found_links = link_extractor.extract_links_from_html(html)
+        if not found_links:
+            # The page did not render its link list without the browser, so an unchanged
+            # HTTP response says nothing about the stream
+            state['validators'] = {}
+            state['html_hash'] = None
+            increment('fetch.browser_fallback')
+            found_links = with_browser(link_extractor.extract_links, url)
+
+        links_hash = get_links_hash(found_links)
+        if links_hash == state['links_hash']:
+            increment('links.poll.unchanged')
+            record_link_poll(state, 0)
+            return new_links
         new_links = update_new_links(found_links)
+        state['links_hash'] = links_hash
+        record_link_poll(state, len(new_links))
     except Exception as e:
+        # Forget the page hash so the next poll parses the page again
+        state['html_hash'] = None
         logging.error(f"Error getting new links for {url} : {e}")
     return new_links
 
-def get_and_store_article(driver, url, article_extractor):
-    try:
-        driver.get(url)
-        handle_cookie_consent(driver)
-        wait = WebDriverWait(driver, 3)
-        wait.until(EC.presence_of_element_located((By.TAG_NAME, 'body')))
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
-        data = article_extractor.extract_article_data(soup)
-        store_article(url, data)
-        return data
-    except Exception as e:
-        logging.error(f"Unexpected error during extraction for URL {url}: {e}")
-        return None
-    
+def get_article_with_browser(driver, url, article_extractor):
+    # Rate limit pages have no title, so extract even when the wait times out
+    load_page(driver, url, getattr(article_extractor, 'WAIT_SELECTOR', None))
+    html = driver.page_source
+    archive_page(url, html, source='browser')
+    data = article_extractor.extract_article_data(make_soup(html))
+    record_extraction_timings(data)
+    return data
+
+def is_rate_limited(data):
+    return bool(data) and data.get('error') == 'rate_limit_reached'
+
+def retry_throttled_article(url, signal_host=True):
+    # A throttled page is not stored; the link stays unscraped until its retry time
+    if signal_host:
+        on_host_rate_limited(get_host(url))
+    increment('fetch.throttled_articles')
+    schedule_link_retry(url)
 
 def get_crypto_type(title):
     matched_cryptos = set()  # Using set to avoid duplicates
@@ -58,51 +145,151 @@ def get_crypto_type(title):
     return list(matched_cryptos)
 
 
-def process_article(url,article_data):
+def copy_duplicate_scores(url, crypto_types):
+    """
+    Copies existing scores from the original of a near-duplicate article.
+
+    Returns:
+        dict: Mapping of crypto to the models that still have to score the article,
+        or to None when the default scoring jobs are still needed.
+    """
+    remaining = {crypto_type: None for crypto_type in crypto_types}
+    conn = sqlite3.connect(DB_NAME, timeout=30)
+    cur = conn.cursor()
+    duplicate_of = get_duplicate_of(cur, url)
+    if duplicate_of:
+        for crypto_type in crypto_types:
+            copied = [model for model in MODELS if copy_news_scores(cur, duplicate_of, url, crypto_type, model)]
+            if CASCADE_CONFIG['enabled']:
+                # The cascade only scores with some of the models, so any copied row is a full copy
+                if copied:
+                    copy_cascade_decisions(cur, duplicate_of, url, crypto_type)
+                    remaining[crypto_type] = []
+            else:
+                remaining[crypto_type] = [model for model in MODELS if model not in copied]
+        conn.commit()
+        logging.info(f"Copied scores of {duplicate_of} to near-duplicate article {url}")
+    conn.close()
+    return remaining
+
+def process_article(url, article_data):
+    if not article_data:
+        return
     crypto_types = get_crypto_type(article_data["title"])
     if crypto_types:
-        conn = sqlite3.connect(DB_NAME)
-        cur = conn.cursor()
-        for crypto_type in crypto_types:
-            for model in MODELS:
-                try:
-                    sentiment = get_model_responses(f"Title: {article_data["title"]}\n\nContent: {article_data["article"]}", model, crypto_type, is_twitter=False)
-                    
-                    # Sanitize the table name
-                    table_name = f"{crypto_type}_{model['name'].replace('/', '_').replace('-', '_').replace('.', '_')}_news"
-                    
-                    # Convert aspect names to lowercase for column names
-                    columns = ', '.join([f'"{key.lower().replace(" ", "_")}"' for key in sentiment.keys()])
-                    placeholders = ', '.join(['?' for _ in sentiment])
-                    values = tuple(sentiment.values())
-                    
-                    cur.execute(f"""
-                        INSERT OR REPLACE INTO "{table_name}" 
-                        (url, {columns})
-                        VALUES (?, {placeholders})
-                    """, (url, *values))
-                    conn.commit()
-                    
-                    logging.info(f"Processed and stored {crypto_type} article for model {model['name']}: {url}")
-                except Exception as e:
-                    logging.error(f"Error processing article {url} for model {model['name']}: {e}")
-            
-                
-        conn.close()
+        remaining = {crypto_type: None for crypto_type in crypto_types}
+        if DEDUP_CONFIG['copy_scores']:
+            remaining = copy_duplicate_scores(url, crypto_types)
+        # Scoring is done by the scorer workers, so a slow model never stalls scraping
+        for crypto_type, models in remaining.items():
+            queued = enqueue_scoring_jobs('news', url, [crypto_type], models)
+            logging.info(f"Queued {queued} scoring jobs for {crypto_type} article: {url}")
+        store_provisional_news_scores(url, article_data["title"], article_data["article"], crypto_types)
     else:
         logging.info(f"Article not related to tracked cryptocurrencies: {url}")
 
-def get_new_articles(driver):
-    link_extractor = EXTRACTORS['link']
-    article_extractor = EXTRACTORS['article']
-    scrape_and_store_links(driver, URL, link_extractor)
+def poll_source_links(source):
+    new_links = []
+    for url in source['urls']:
+        new_links.extend(scrape_and_store_links(url, source['link_extractor']))
+    return new_links
+
+def drain_article_backlog(source=None):
+    """
+    Streams the unscraped links through the fetch, parse, store and score stages.
+    Stages are connected by bounded queues, so a large backlog never holds more than
+    a few pages in memory. Each link is extracted by the article extractor of its domain.
+
+    Parameters:
+        source (dict): Only drain the links on this source's domains, with its
+            concurrency as the number of fetch and browser workers. All links by default.
+
+    Returns:
+        int: The number of links sent through the pipeline.
+    """
+    fetch_workers = source['concurrency'] if source else PIPELINE_CONFIG['fetch_workers']
+    # The source's budget also caps its share of the browser pool
+    browser_workers = max(get_browser_pool_size(), 1)
+    if source:
+        browser_workers = min(browser_workers, source['concurrency'])
+    name = f".{source['name']}" if source else ''
+
+    queue_size = PIPELINE_CONFIG['queue_size']
+    fetch_queue = make_stage_queue(f'fetch{name}', queue_size)
+    parse_queue = make_stage_queue(f'parse{name}', queue_size)
+    browser_queue = make_stage_queue(f'browser{name}', queue_size)
+    store_queue = make_stage_queue(f'store{name}', queue_size)
+    score_queue = make_stage_queue(f'score{name}', queue_size)
+    executor = get_parse_executor(PIPELINE_CONFIG['parse_workers'])
+
+    def fetch(url):
+        if get_article_extractor(url) is None:
+            logging.warning(f"No article extractor for {url}")
+            return
+        if is_host_paused(url):
+            # Left unscraped for a later cycle instead of blocking a worker for the whole pause
+            increment('fetch.host_deferred')
+            return
+        html = fetch_html(url)
+        if html:
+            archive_page(url, html)
+            parse_queue.put((url, html))
+        elif get_host_backoff(url) > 0:
+            # The host answered 429/503, which already paused it
+            retry_throttled_article(url, signal_host=False)
+        else:
+            browser_queue.put(url)
+
+    def parse(item):
+        url, html = item
+        data = executor.submit(extract_from_html, get_article_extractor(url).__name__, html).result()
+        record_extraction_timings(data)
+        if is_rate_limited(data):
+            retry_throttled_article(url)
+        elif not data.get('title') or not data.get('article'):
+            # Only load the page in the browser when the plain HTTP response did not extract
+            browser_queue.put(url)
+        else:
+            store_queue.put((url, data))
+
+    def fetch_with_browser(url):
+        if is_host_paused(url):
+            increment('fetch.host_deferred')
+            return
+        increment('fetch.browser_fallback')
+        data = with_browser(get_article_with_browser, url, get_article_extractor(url))
+        if is_rate_limited(data):
+            retry_throttled_article(url)
+        else:
+            store_queue.put((url, data))
 
-    articles_data = {}
-    new_links = get_unscraped_links()
-    for link in new_links:
-        articles_data[link] = get_and_store_article(driver, link, article_extractor)
-        process_article(link, articles_data[link])
+    def store(item):
+        store_article(*item)
+        score_queue.put(item)
 
-    return articles_data
+    def score(item):
+        process_article(*item)
 
+    # In upstream-to-downstream order, which is also the order they are stopped in
+    stages = [
+        start_stage(f'fetch{name}', fetch, fetch_queue, fetch_workers),
+        start_stage(f'parse{name}', parse, parse_queue, PIPELINE_CONFIG['parse_workers']),
+        start_stage(f'browser{name}', fetch_with_browser, browser_queue, browser_workers),
+        start_stage(f'store{name}', store, store_queue, 1),
+        start_stage(f'score{name}', score, score_queue, 1),
+    ]
+    links = 0
+    for link in get_unscraped_links():
+        if source and not matches_domain(get_host(link), source['domains']):
+            continue
+        fetch_queue.put(link)
+        links += 1
+    for stage in stages:
+        stop_stage(stage)
 
+    log_stage_throughput(stages)
+    log_metrics('fetch')
+    log_metrics('browser')
+    log_metrics('links')
+    log_metrics('pipeline')
+    return links
@@ -0,0 +1,230 @@
+# utils/templates.py
+
+import glob
+import json
+import logging
+import os
+import re
+import time
+
+import soupsieve
+from bs4 import Tag
+
+import params
+from utils.parsing import extract_content
+
+TEMPLATE_CONFIG = params.get_template_config()
+
+
+def get_value(element, attribute):
+    # 'text' and 'content' are the element's text, flat or with paragraphs, lists and tables kept
+    if attribute == 'text':
+        return element.get_text(strip=True)
+    if attribute == 'content':
+        return extract_content(element)
+    if attribute == 'html':
+        return str(element)
+    value = element.get(attribute)
+    return ' '.join(value) if isinstance(value, list) else value
+
+def compile_field(spec):
+    """
+    Compiles a field spec into a selector plan. A spec is either a CSS selector, for
+    the text of the first match, or a dict with:
+        selector (str): CSS selector, relative to the parent element for inner specs.
+        attribute (str): 'text' (default), 'content', 'html' or an attribute name.
+        index (int or list): One match as a value, or a list of matches. All matches by default.
+        inner (dict): A spec evaluated inside each match instead of taking its attribute.
+        pattern (str): Regex applied to the values; group 1 is kept, non-matching values dropped.
+        unique (bool): Drop repeated values.
+        default: The value when nothing matches, '' for a single value.
+
+    Returns:
+        dict: The plan.
+    """
+    if isinstance(spec, str):
+        spec = {'selector': spec, 'index': 0}
+    index = spec.get('index')
+    if isinstance(index, int):
+        limit = index + 1
+    elif index:
+        limit = max(index) + 1
+    else:
+        limit = None
+    return {
+        'selector': spec['selector'],
+        'compiled': soupsieve.compile(spec['selector']),
+        'attribute': spec.get('attribute', 'text'),
+        'index': index,
+        'limit': limit,
+        'inner': compile_field(spec['inner']) if 'inner' in spec else None,
+        'pattern': re.compile(spec['pattern']) if 'pattern' in spec else None,
+        'unique': spec.get('unique', False),
+        'default': spec.get('default', '' if isinstance(index, int) else []),
+    }
+
+def get_selector_key(selector):
+    """
+    Returns the index key of a selector: what the element it selects must have, taken
+    from the last compound selector. An id is the most selective, then a class, then
+    the tag name. Selector lists and selectors without any of them are keyed ('any',).
+    """
+    if ',' in selector:
+        return ('any',)
+    # Attribute values and pseudo-class arguments can hold dots, hashes and spaces
+    stripped = re.sub(r'\[[^\]]*\]|\([^)]*\)', '', selector.strip())
+    compound = re.split(r'[\s>+~]+', stripped)[-1]
+    element_id = re.search(r'#([\w-]+)', compound)
+    if element_id:
+        return ('id', element_id.group(1))
+    class_name = re.search(r'\.([\w-]+)', compound)
+    if class_name:
+        return ('class', class_name.group(1))
+    tag = re.match(r'[a-zA-Z][\w-]*', compound)
+    if tag:
+        return ('tag', tag.group(0).lower())
+    return ('any',)
+
+def compile_template(name, template):
+    """
+    Compiles a template: its article fields, plus the domains it handles, the element
+    the browser waits for, the field that tells a real article page apart and the page
+    texts that mark error pages.
+    """
+    fields = {field: compile_field(spec) for field, spec in template['fields'].items()}
+    # Fields sharing a selector are matched once
+    selectors = {}
+    for field, plan in fields.items():
+        group = selectors.setdefault(plan['selector'], {'compiled': plan['compiled'], 'limit': plan['limit'], 'fields': []})
+        if group['limit'] is not None:
+            group['limit'] = None if plan['limit'] is None else max(group['limit'], plan['limit'])
+        group['fields'].append(field)
+    # Selectors by the id, class or tag an element needs to match them
+    index = {}
+    for selector in selectors:
+        index.setdefault(get_selector_key(selector), []).append(selector)
+    return {
+        'name': name,
+        'domains': template.get('domains', []),
+        'wait_selector': template.get('wait_selector'),
+        'required': template.get('required'),
+        'errors': template.get('errors', {}),
+        'fields': fields,
+        'selectors': selectors,
+        'index': index,
+    }
+
+def load_templates(directory=None):
+    """
+    Loads and compiles every JSON template in the templates directory, named after
+    its file.
+
+    Returns:
+        dict: Mapping of template name to compiled template.
+    """
+    directory = directory or TEMPLATE_CONFIG['dir']
+    templates = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        try:
+            with open(path, encoding='utf-8') as f:
+                templates[name] = compile_template(name, json.load(f))
+        except Exception as e:
+            logging.error(f"Failed to load template {path}: {e}")
+    return templates
+
+def get_candidate_selectors(index, element):
+    candidates = list(index.get(('any',), ()))
+    candidates.extend(index.get(('tag', element.name), ()))
+    element_id = element.get('id')
+    if element_id:
+        candidates.extend(index.get(('id', element_id), ()))
+    for class_name in set(element.get('class') or ()):
+        candidates.extend(index.get(('class', class_name), ()))
+    return candidates
+
+def find_matches(template, soup):
+    """
+    Finds the elements of every selector in one pass over the document. Only the
+    selectors indexed under an element's tag, id or classes are matched against it,
+    and a selector is dropped once it has all the matches its fields need.
+
+    Returns:
+        dict: Mapping of selector to its matches in document order.
+    """
+    selectors = template['selectors']
+    matches = {selector: [] for selector in selectors}
+    index = {key: list(group) for key, group in template['index'].items()}
+    pending = len(selectors)
+    for element in soup.descendants:
+        if not isinstance(element, Tag):
+            continue
+        for selector in get_candidate_selectors(index, element):
+            group = selectors[selector]
+            if group['compiled'].match(element):
+                matches[selector].append(element)
+                if len(matches[selector]) == group['limit']:
+                    index[get_selector_key(selector)].remove(selector)
+                    pending -= 1
+        if not pending:
+            break
+    return matches
+
+def evaluate_field(plan, elements):
+    if plan['index'] is not None:
+        indexes = [plan['index']] if isinstance(plan['index'], int) else plan['index']
+        elements = [elements[i] for i in indexes if i < len(elements)]
+
+    values = []
+    for element in elements:
+        if plan['inner']:
+            values.append(evaluate_field(plan['inner'], plan['inner']['compiled'].select(element, limit=plan['inner']['limit'] or 0)))
+        else:
+            values.append(get_value(element, plan['attribute']))
+
+    if plan['pattern']:
+        searched = [plan['pattern'].search(value) for value in values if isinstance(value, str)]
+        values = [match.group(1) if match.re.groups else match.group(0) for match in searched if match]
+    if plan['unique']:
+        values = list(dict.fromkeys(values))
+
+    if isinstance(plan['index'], int):
+        return values[0] if values and values[0] is not None else plan['default']
+    return values or plan['default']
+
+def evaluate_template(template, soup):
+    """
+    Extracts the fields of a compiled template from a parsed page.
+
+    Returns:
+        dict: Field name mapped to its value, plus 'error' when the required field is
+        missing and the page is a known error page. The matching and per-field times
+        are returned under '_timings', since extraction usually runs in a parse worker
+        process whose metrics the scraper never sees; see record_extraction_timings.
+    """
+    name = template['name']
+    timings = {}
+    started = time.perf_counter()
+    matches = find_matches(template, soup)
+    timings[f"template.{name}.match"] = time.perf_counter() - started
+
+    article_data = {}
+    for field, plan in template['fields'].items():
+        field_started = time.perf_counter()
+        try:
+            article_data[field] = evaluate_field(plan, matches[plan['selector']])
+        except Exception as e:
+            logging.error(f"Error extracting {field} with template {name}: {e}")
+            article_data[field] = plan['default']
+        timings[f"template.{name}.{field}"] = time.perf_counter() - field_started
+
+    required = template['required']
+    if required and not article_data.get(required) and template['errors']:
+        text = soup.get_text()
+        for error, markers in template['errors'].items():
+            # Each marker is a list of texts that must all be on the page
+            if any(all(part in text for part in marker) for marker in markers):
+                article_data['error'] = error
+                break
+    article_data['_timings'] = timings
+    return article_data
@@ -3,7 +3,6 @@ import time
 import requests
 import logging
 import params
-import sqlite3
 from utils.database import store_twitter_data
 import params
 
@@ -13,7 +12,8 @@ DB_NAME = params.get_db_name()
 MODELS = params.get_models()
 CRYPTO_KEYWORDS = params.get_crypto_keywords()
 
-from utils.sentimemt import get_model_responses
+from utils.jobs import enqueue_scoring_jobs
+from utils.distill import store_provisional_twitter_scores
 from keys.twitter import bearer_token
 LAST_API_CALL = {}
 
@@ -50,6 +50,17 @@ def is_within_time_window():
     now = datetime.now(timezone.utc)
     return 55 <= now.minute <= 59
 
+def get_twitter_interval(now=None):
+    """
+    Returns the seconds until the next run of the twitter task, which is aimed half a
+    minute into the next :55-:59 window so a slightly late start still falls inside it.
+    """
+    now = now or datetime.now(timezone.utc)
+    next_run = now.replace(minute=55, second=30, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(hours=1)
+    return (next_run - now).total_seconds()
+
 def should_scrape_twitter(crypto_name):
     global LAST_API_CALL
     now = datetime.now(timezone.utc)
@@ -107,26 +118,8 @@ def process_twitter_data():
         # Store original Twitter data
         store_twitter_data(tweets, crypto_name)
 
-        conn = sqlite3.connect(DB_NAME)
-        cur = conn.cursor()
-        
-        for model in MODELS:
-            table_name = f"{crypto_name}_{model['name'].replace('/', '_').replace('-', '_').replace('.', '_')}_twitter"
-            
-            for tweet in tweets:
-                sentiment = get_model_responses(f"Tweet: {tweet['text']}", model, crypto_name, is_twitter=True)
-                
-                columns = ', '.join([f'"{key.lower().replace(" ", "_")}"' for key in sentiment.keys()])
-                placeholders = ', '.join(['?' for _ in sentiment])
-                values = tuple(sentiment.values())
-                
-                cur.execute(f"""
-                    INSERT OR REPLACE INTO "{table_name}" 
-                    (tweet_id, author_id, text, created_at, {columns})
-                    VALUES (?, ?, ?, ?, {placeholders})
-                """, (tweet['id'], tweet['author_id'], tweet['text'], tweet['created_at'], *values))
-                
-                logging.info(f"Processed and stored {crypto_name} tweet for model {model['name']}: {tweet['id']}")
-        
-        conn.commit()
-        conn.close()
+        # Scoring is done by the scorer workers
+        for tweet in tweets:
+            enqueue_scoring_jobs('twitter', tweet['id'], [crypto_name])
+        logging.info(f"Queued scoring jobs for {len(tweets)} {crypto_name} tweets.")
+        store_provisional_twitter_scores(tweets, crypto_name)